@@ -1,9 +1,77 @@
 import logging
+import math
+import multiprocessing as mp
 
+import numpy as np
 from tqdm import tqdm
 
 log = logging.getLogger(__name__)
 
+# per-process state of the arena workers, set by _initArenaWorker
+_worker = {}
+
+
+def _initArenaWorker(player1, player2, game):
+    _worker['arena'] = Arena(player1, player2, game)
+
+
+def _playArenaGame(task):
+    """
+    Plays one game in a worker. task is (seed, swapped): swapped games are
+    started by player2.
+
+    Returns:
+        result: the game result from the point of view of player1
+    """
+    seed, swapped = task
+    arena = _worker['arena']
+    player1, player2 = arena.player1, arena.player2
+    if swapped:
+        arena.player1, arena.player2 = player2, player1
+    arena.startGame(seed)
+    result = arena.playGame()
+    arena.player1, arena.player2 = player1, player2
+    return -result if swapped else result
+
+
+class SPRT():
+    """
+    Sequential probability ratio test on the fraction of decisive games won by
+    player2 (the challenger, as in Coach), to be passed to Arena.playGames as
+    stopRule.
+
+    It tests H0: p <= threshold - delta against H1: p >= threshold + delta,
+    with false acceptance rate alpha and false rejection rate beta. Draws
+    carry no information and are ignored, as in the updateThreshold rule.
+    """
+
+    def __init__(self, threshold, delta=0.1, alpha=0.05, beta=0.05):
+        self.p0 = max(threshold - delta, 1e-3)
+        self.p1 = min(threshold + delta, 1 - 1e-3)
+        # log likelihood ratio of a win and of a loss of player2
+        self.winLLR = math.log(self.p1 / self.p0)
+        self.lossLLR = math.log((1 - self.p1) / (1 - self.p0))
+        self.upper = math.log((1 - beta) / alpha)
+        self.lower = math.log(beta / (1 - alpha))
+        self.llr = 0.
+        self.decision = None  # True if H1 was accepted, False if H0 was, None while undecided
+
+    def __repr__(self):
+        state = {None: 'undecided', True: 'accept', False: 'reject'}[self.decision]
+        return f'SPRT({state}, llr={self.llr:.2f} in [{self.lower:.2f}, {self.upper:.2f}])'
+
+    def __call__(self, oneWon, twoWon, draws):
+        """
+        Returns:
+            stop: True once the test is decided
+        """
+        self.llr = twoWon * self.winLLR + oneWon * self.lossLLR
+        if self.llr >= self.upper:
+            self.decision = True
+        elif self.llr <= self.lower:
+            self.decision = False
+        return self.decision is not None
+
 
 class Arena():
     """
@@ -62,11 +130,37 @@ class Arena():
             self.display(board)
         return curPlayer * self.game.getGameEnded(board, curPlayer)
 
-    def playGames(self, num, verbose=False):
+    def startGame(self, seed):
+        """
+        Prepares a new game: resets the players that keep state between moves
+        (those with a reset method, e.g. MCTSPlayer) and seeds the global RNG,
+        unless seed is None. A game then only depends on its own seed, not on
+        the games played before it.
+        """
+        for player in (self.player1, self.player2):
+            if hasattr(player, 'reset'):
+                player.reset()
+        if seed is not None:
+            np.random.seed(seed)
+
+    def playGames(self, num, verbose=False, numWorkers=1, seed=None, stopRule=None):
         """
         Plays num games in which player1 starts num/2 games and player2 starts
         num/2 games.
 
+        If stopRule is given (e.g. an SPRT) it is called with the running
+        (oneWon, twoWon, draws) after every game and the match ends as soon as
+        it returns True. The two players then take turns at starting, so that
+        neither has started more games than the other when the match stops.
+
+        In both cases player1 and player2 are swapped when the match ends.
+
+        With numWorkers > 1 the games are spread over a pool of processes; the
+        players are then sent to the workers, so they must be picklable (e.g.
+        MCTSPlayer). If seed is not None every game is played with the global
+        RNG seeded from seed and its index, so the results do not depend on
+        numWorkers.
+
         Returns:
             oneWon: games won by player1
             twoWon: games won by player2
@@ -74,27 +168,99 @@ class Arena():
         """
 
         num = int(num / 2)
-        oneWon = 0
-        twoWon = 0
-        draws = 0
-        for _ in tqdm(range(num), desc="Arena.playGames (1)"):
-            gameResult = self.playGame(verbose=verbose)
-            if gameResult == 1:
-                oneWon += 1
-            elif gameResult == -1:
-                twoWon += 1
-            else:
-                draws += 1
+        if seed is None:
+            seeds = [None] * (2 * num)
+        else:
+            seeds = [int(np.random.SeedSequence([seed, k]).generate_state(1)[0]) for k in range(2 * num)]
+
+        if stopRule is not None:
+            results = self.playGamesUntil(stopRule, seeds, verbose, numWorkers)
+            self.player1, self.player2 = self.player2, self.player1
+            return results
+
+        if numWorkers > 1:
+            # spawn rather than fork: a forked TensorFlow runtime is not usable
+            ctx = mp.get_context('spawn')
+            tasks = [(seeds[k], k >= num) for k in range(2 * num)]
+            with ctx.Pool(numWorkers, initializer=_initArenaWorker,
+                          initargs=(self.player1, self.player2, self.game)) as pool:
+                results = list(tqdm(pool.imap(_playArenaGame, tasks), total=len(tasks), desc="Arena.playGames"))
+            self.player1, self.player2 = self.player2, self.player1
+        else:
+            results = []
+            for k in tqdm(range(num), desc="Arena.playGames (1)"):
+                self.startGame(seeds[k])
+                results.append(self.playGame(verbose=verbose))
 
-        self.player1, self.player2 = self.player2, self.player1
+            self.player1, self.player2 = self.player2, self.player1
 
-        for _ in tqdm(range(num), desc="Arena.playGames (2)"):
-            gameResult = self.playGame(verbose=verbose)
-            if gameResult == -1:
-                oneWon += 1
-            elif gameResult == 1:
-                twoWon += 1
+            for k in tqdm(range(num), desc="Arena.playGames (2)"):
+                self.startGame(seeds[num + k])
+                results.append(-self.playGame(verbose=verbose))
+
+        oneWon = sum(1 for r in results if r == 1)
+        twoWon = sum(1 for r in results if r == -1)
+        draws = len(results) - oneWon - twoWon
+
+        return oneWon, twoWon, draws
+
+    def playGamesUntil(self, stopRule, seeds, verbose=False, numWorkers=1):
+        """
+        Plays len(seeds) games, the k-th one started by player2 if k is odd,
+        until stopRule returns True. Called by playGames.
+
+        The results are consumed in game order also when the games are spread
+        over numWorkers processes, so the stopping point does not depend on
+        numWorkers; the games still running when the match stops are dropped.
+
+        Returns:
+            oneWon, twoWon, draws: as playGames, for the games consumed
+        """
+        tasks = [(seeds[k], k % 2 == 1) for k in range(len(seeds))]
+        oneWon = twoWon = draws = 0
+        pool = None
+        if numWorkers > 1:
+            ctx = mp.get_context('spawn')
+            pool = ctx.Pool(numWorkers, initializer=_initArenaWorker,
+                            initargs=(self.player1, self.player2, self.game))
+            results = pool.imap(_playArenaGame, tasks)
+        else:
+            results = (self.playSeededGame(task, verbose) for task in tasks)
+
+        try:
+            for k, result in enumerate(tqdm(results, total=len(tasks), desc="Arena.playGames"), 1):
+                if result == 1:
+                    oneWon += 1
+                elif result == -1:
+                    twoWon += 1
+                else:
+                    draws += 1
+                if stopRule(oneWon, twoWon, draws):
+                    log.info(f'Arena stopped after {k}/{len(tasks)} games: {stopRule}')
+                    break
             else:
-                draws += 1
+                log.info(f'Arena played all {len(tasks)} games: {stopRule}')
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
 
         return oneWon, twoWon, draws
+
+    def playSeededGame(self, task, verbose=False):
+        """
+        Plays the (seed, swapped) game of playGamesUntil in this process.
+
+        Returns:
+            result: the game result from the point of view of player1
+        """
+        seed, swapped = task
+        if swapped:
+            self.player1, self.player2 = self.player2, self.player1
+        try:
+            self.startGame(seed)
+            result = self.playGame(verbose=verbose)
+        finally:
+            if swapped:
+                self.player1, self.player2 = self.player2, self.player1
+        return -result if swapped else result
@@ -1,33 +1,60 @@
 import logging
+import multiprocessing as mp
 import os
 import sys
 from collections import deque
-from pickle import Pickler, Unpickler
-from random import shuffle
+from pickle import Unpickler
 
 import numpy as np
 from tqdm import tqdm
 
-from Arena import Arena
-from MCTS import MCTS
+from Arena import Arena, SPRT
+from InferenceServer import InferenceServer
+from MCTS import MCTS, MCTSPlayer
+from ReplayBuffer import ReplayBuffer
 
 log = logging.getLogger(__name__)
 
+# per-process state of the self-play workers, set by _initSelfPlayWorker
+_worker = {}
 
-class Coach():
+
+def _initSelfPlayWorker(game, nnetClass, args, clients=None, nextClient=None):
     """
-    This class executes the self-play + learning. It uses the functions defined
-    in Game and NeuralNet. args are specified in main.py.
+    Pool initializer: every worker builds its own copy of the network from the
+    'temp.pth.tar' checkpoint saved by Coach.selfPlay, or, when clients are
+    given, takes the first unused InferenceClient of the shared server.
+    """
+    if clients is not None:
+        with nextClient.get_lock():
+            nnet = clients[nextClient.value]
+            nextClient.value += 1
+    else:
+        nnet = nnetClass(game)
+        nnet.load_checkpoint(folder=args.checkpoint, filename='temp.pth.tar')
+    _worker['runner'] = SelfPlayRunner(game, nnet, args)
+
+
+def _selfPlayEpisode(seed):
+    """
+    Runs one self-play episode in a worker, with a fresh search tree and the
+    global RNG seeded with seed.
+    """
+    return _worker['runner'].runEpisode(seed)
+
+
+class SelfPlayRunner():
+    """
+    Plays self-play episodes with an MCTS over nnet. It holds only what an
+    episode needs, so the self-play workers build one of these rather than a
+    whole Coach (with its replay buffer and competitor network).
     """
 
     def __init__(self, game, nnet, args):
         self.game = game
         self.nnet = nnet
-        self.pnet = self.nnet.__class__(self.game)  # the competitor network
         self.args = args
         self.mcts = MCTS(self.game, self.nnet, self.args)
-        self.trainExamplesHistory = []  # history of examples from args.numItersForTrainExamplesHistory latest iterations
-        self.skipFirstSelfPlay = False  # can be overriden in loadTrainExamples()
 
     def executeEpisode(self):
         """
@@ -41,43 +68,136 @@ class Coach():
         uses temp=0.
 
         Returns:
-            trainExamples: a list of examples of the form (canonicalBoard, currPlayer, pi,v)
+            trainExamples: a list of examples of the form (observation, pi, v),
+                           one for every symmetrical form of every position.
                            pi is the MCTS informed policy vector, v is +1 if
                            the player eventually won the game, else -1.
         """
         trainExamples = []
         board = self.game.getInitBoard()
-        self.curPlayer = 1
+        curPlayer = 1
         episodeStep = 0
 
         while True:
             episodeStep += 1
-            canonicalBoard = self.game.getCanonicalForm(board, self.curPlayer)
+            canonicalBoard = self.game.getCanonicalForm(board, curPlayer)
             temp = int(episodeStep < self.args.tempThreshold)
-            print("---------------------------------")
-
-            print(canonicalBoard)
-            print("---------------------------------")
-            
-            pi = self.mcts.getActionProb(canonicalBoard, temp=temp)     
-               
-            print("AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAa")
-
-            print(pi)
-            print(len(pi))     
-            print("AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA")
 
-            sym = self.game.getSymmetries(canonicalBoard, pi)
-            for b, p in sym:
-                trainExamples.append([b, self.curPlayer, p, None])
+            pi = self.mcts.getActionProb(canonicalBoard, temp=temp)
+            trainExamples.append([self.game.getObservation(canonicalBoard), curPlayer, pi])
 
             action = np.random.choice(len(pi), p=pi)
-            board, self.curPlayer = self.game.getNextState(board, self.curPlayer, action)
+            board, curPlayer = self.game.getNextState(board, curPlayer, action)
 
-            r = self.game.getGameEnded(board, self.curPlayer)
+            r = self.game.getGameEnded(board, curPlayer)
 
             if r != 0:
-                return [(x[0], x[2], r * ((-1) ** (x[1] != self.curPlayer))) for x in trainExamples]
+                # symmetrical forms of all the positions of the episode at once
+                boards, pis = self.game.getSymmetriesBatch(np.array([x[0] for x in trainExamples]),
+                                                           np.array([x[2] for x in trainExamples]))
+                vs = [r * ((-1) ** (x[1] != curPlayer)) for x in trainExamples]
+                vs = np.repeat(vs, len(boards) // len(trainExamples))
+                return list(zip(boards, pis, vs))
+
+    def runEpisode(self, seed=None):
+        """
+        Resets the search tree and executes one episode of self-play. If seed
+        is not None the global RNG is seeded with it first, which makes the
+        episode reproducible wherever it runs.
+        """
+        if seed is not None:
+            np.random.seed(seed)
+        self.mcts = MCTS(self.game, self.nnet, self.args)  # reset search tree
+        return self.executeEpisode()
+
+
+class Coach():
+    """
+    This class executes the self-play + learning. It uses the functions defined
+    in Game and NeuralNet. args are specified in main.py.
+    """
+
+    def __init__(self, game, nnet, args):
+        self.game = game
+        self.nnet = nnet
+        self.pnet = self.nnet.__class__(self.game)  # the competitor network
+        self.args = args
+        self.runner = SelfPlayRunner(self.game, self.nnet, self.args)
+        # examples from the args.numItersForTrainExamplesHistory latest iterations
+        self.replayBuffer = ReplayBuffer(self.game.getBoardSize(), self.game.getActionSize(),
+                                         args.maxlenOfQueue * args.numItersForTrainExamplesHistory,
+                                         args.numItersForTrainExamplesHistory)
+        self.skipFirstSelfPlay = False  # can be overriden in loadTrainExamples()
+
+    def executeEpisode(self):
+        """
+        Executes one episode of self-play with the current search tree, see
+        SelfPlayRunner.executeEpisode.
+        """
+        return self.runner.executeEpisode()
+
+    def runEpisode(self, seed=None):
+        """
+        Resets the search tree and executes one episode of self-play, see
+        SelfPlayRunner.runEpisode.
+        """
+        return self.runner.runEpisode(seed)
+
+    def episodeSeeds(self, iteration):
+        """
+        Returns the seeds of the numEps episodes of an iteration, derived from
+        args.seed, or a list of None if args.seed is None.
+        """
+        seed = self.args.get('seed')
+        if seed is None:
+            return [None] * self.args.numEps
+        return [int(np.random.SeedSequence([seed, iteration, k]).generate_state(1)[0])
+                for k in range(self.args.numEps)]
+
+    def selfPlay(self, iteration):
+        """
+        Plays the numEps self-play episodes of an iteration, spreading them over
+        args.numSelfPlayWorkers processes when it is larger than 1. Every worker
+        loads its own copy of the current network from 'temp.pth.tar', unless
+        args.inferenceServer is set: then the workers query an InferenceServer
+        that evaluates their boards in batches with the network of this
+        process.
+
+        Each episode is seeded from args.seed, the iteration and its index, and
+        the results are yielded in episode order, so the examples only depend
+        on the seed and not on the number of workers.
+
+        Yields:
+            trainExamples: the examples of each episode, as returned by
+                           executeEpisode
+        """
+        seeds = self.episodeSeeds(iteration)
+        numWorkers = self.args.get('numSelfPlayWorkers', 1)
+        if numWorkers <= 1:
+            for seed in tqdm(seeds, desc="Self Play"):
+                yield self.runEpisode(seed)
+            return
+
+        # spawn rather than fork: a forked TensorFlow runtime is not usable
+        ctx = mp.get_context('spawn')
+        server = None
+        if self.args.get('inferenceServer', False):
+            server = InferenceServer(nnet=self.nnet, maxBatchSize=self.args.get('inferenceBatchSize', 64),
+                                     maxWait=self.args.get('inferenceMaxWait', 0.002))
+            initargs = (self.game, None, self.args, server.start(numWorkers, ctx),
+                        ctx.Value('i', 0))
+        else:
+            self.nnet.save_checkpoint(folder=self.args.checkpoint, filename='temp.pth.tar')
+            initargs = (self.game, self.nnet.__class__, self.args)
+
+        try:
+            with ctx.Pool(numWorkers, initializer=_initSelfPlayWorker,
+                          initargs=initargs) as pool:
+                for examples in tqdm(pool.imap(_selfPlayEpisode, seeds), total=len(seeds), desc="Self Play"):
+                    yield examples
+        finally:
+            if server is not None:
+                server.stop()
 
     def learn(self):
         """
@@ -85,7 +205,8 @@ class Coach():
         iteration. After every iteration, it retrains neural network with
         examples in trainExamples (which has a maximum length of maxlenofQueue).
         It then pits the new neural network against the old one and accepts it
-        only if it wins >= updateThreshold fraction of games.
+        only if it wins >= updateThreshold fraction of games. With arenaSPRT
+        the match stops as soon as a sequential test settles the decision.
         """
 
         for i in range(1, self.args.numIters + 1):
@@ -95,42 +216,48 @@ class Coach():
             if not self.skipFirstSelfPlay or i > 1:
                 iterationTrainExamples = deque([], maxlen=self.args.maxlenOfQueue)
 
-                for _ in tqdm(range(self.args.numEps), desc="Self Play"):
-                    self.mcts = MCTS(self.game, self.nnet, self.args)  # reset search tree
-                    iterationTrainExamples += self.executeEpisode()
+                for examples in self.selfPlay(i):
+                    iterationTrainExamples += examples
 
-                # save the iteration examples to the history 
-                self.trainExamplesHistory.append(iterationTrainExamples)
+                # save the iteration examples to the history, dropping the
+                # oldest iteration beyond numItersForTrainExamplesHistory
+                if iterationTrainExamples:
+                    self.replayBuffer.addIteration(*ReplayBuffer.stack(iterationTrainExamples))
 
-            if len(self.trainExamplesHistory) > self.args.numItersForTrainExamplesHistory:
-                log.warning(
-                    f"Removing the oldest entry in trainExamples. len(trainExamplesHistory) = {len(self.trainExamplesHistory)}")
-                self.trainExamplesHistory.pop(0)
             # backup history to a file
             # NB! the examples were collected using the model from the previous iteration, so (i-1)  
             self.saveTrainExamples(i - 1)
 
-            # shuffle examples before training
-            trainExamples = []
-            for e in self.trainExamplesHistory:
-                trainExamples.extend(e)
-            shuffle(trainExamples)
-
             # training new network, keeping a copy of the old one
             self.nnet.save_checkpoint(folder=self.args.checkpoint, filename='temp.pth.tar')
             self.pnet.load_checkpoint(folder=self.args.checkpoint, filename='temp.pth.tar')
-            pmcts = MCTS(self.game, self.pnet, self.args)
+            pplayer = MCTSPlayer(self.game, self.pnet, self.args, checkpoint=(self.args.checkpoint, 'temp.pth.tar'))
 
-            self.nnet.train(trainExamples)
-            nmcts = MCTS(self.game, self.nnet, self.args)
+            self.nnet.train(self.replayBuffer)
+            nplayer = MCTSPlayer(self.game, self.nnet, self.args, checkpoint=(self.args.checkpoint, 'new.pth.tar'))
+            numArenaWorkers = self.args.get('numArenaWorkers', 1)
+            if numArenaWorkers > 1:
+                # the arena workers load the new network from its checkpoint
+                self.nnet.save_checkpoint(folder=self.args.checkpoint, filename='new.pth.tar')
 
             log.info('PITTING AGAINST PREVIOUS VERSION')
-            arena = Arena(lambda x: np.argmax(pmcts.getActionProb(x, temp=0)),
-                          lambda x: np.argmax(nmcts.getActionProb(x, temp=0)), self.game)
-            pwins, nwins, draws = arena.playGames(self.args.arenaCompare)
+            arena = Arena(pplayer, nplayer, self.game)
+            arenaSeed = None if self.args.get('seed') is None else int(
+                np.random.SeedSequence([self.args.seed, i]).generate_state(1)[0])
+            sprt = None
+            if self.args.get('arenaSPRT', False):
+                sprt = SPRT(self.args.updateThreshold, self.args.arenaSPRTDelta,
+                            self.args.arenaSPRTAlpha, self.args.arenaSPRTBeta)
+            pwins, nwins, draws = arena.playGames(self.args.arenaCompare, numWorkers=numArenaWorkers,
+                                                  seed=arenaSeed, stopRule=sprt)
 
             log.info('NEW/PREV WINS : %d / %d ; DRAWS : %d' % (nwins, pwins, draws))
-            if pwins + nwins == 0 or float(nwins) / (pwins + nwins) < self.args.updateThreshold:
+            if sprt is not None and sprt.decision is not None:
+                accept = sprt.decision
+            else:
+                # undecided test or no test: fall back to the win ratio
+                accept = pwins + nwins > 0 and float(nwins) / (pwins + nwins) >= self.args.updateThreshold
+            if not accept:
                 log.info('REJECTING NEW MODEL')
                 self.nnet.load_checkpoint(folder=self.args.checkpoint, filename='temp.pth.tar')
             else:
@@ -141,28 +268,42 @@ class Coach():
     def getCheckpointFile(self, iteration):
         return 'checkpoint_' + str(iteration) + '.pth.tar'
 
+    def examplesFolder(self, folder):
+        return os.path.join(folder, 'examples')
+
     def saveTrainExamples(self, iteration):
-        folder = self.args.checkpoint
-        if not os.path.exists(folder):
-            os.makedirs(folder)
-        filename = os.path.join(folder, self.getCheckpointFile(iteration) + ".examples")
-        with open(filename, "wb+") as f:
-            Pickler(f).dump(self.trainExamplesHistory)
-        f.closed
+        """
+        Saves the replay buffer to the examples folder of args.checkpoint.
+        Only the iterations not saved yet are written, so the cost does not
+        grow with the history.
+        """
+        self.replayBuffer.save(self.examplesFolder(self.args.checkpoint))
 
     def loadTrainExamples(self):
+        folder = self.examplesFolder(self.args.load_folder_file[0])
         modelFile = os.path.join(self.args.load_folder_file[0], self.args.load_folder_file[1])
         examplesFile = modelFile + ".examples"
-        if not os.path.isfile(examplesFile):
-            log.warning(f'File "{examplesFile}" with trainExamples not found!')
+        if ReplayBuffer.exists(folder):
+            log.info("Folder with trainExamples found. Loading it...")
+            self.replayBuffer = ReplayBuffer.load(folder, self.replayBuffer.capacity, self.replayBuffer.maxIterations)
+        elif os.path.isfile(examplesFile):
+            # examples saved as a single pickle by older versions
+            log.info("File with trainExamples found. Loading it...")
+            with open(examplesFile, "rb") as f:
+                history = Unpickler(f).load()
+            if isinstance(history, ReplayBuffer):
+                self.replayBuffer = history
+            else:
+                # list of the examples of every iteration
+                for iterationTrainExamples in history:
+                    self.replayBuffer.addIteration(*ReplayBuffer.stack(iterationTrainExamples))
+        else:
+            log.warning(f'Folder "{folder}" with trainExamples not found!')
             r = input("Continue? [y|n]")
             if r != "y":
                 sys.exit()
-        else:
-            log.info("File with trainExamples found. Loading it...")
-            with open(examplesFile, "rb") as f:
-                self.trainExamplesHistory = Unpickler(f).load()
-            log.info('Loading done!')
+            return
+        log.info('Loading done!')
 
-            # examples based on the model were already collected (loaded)
-            self.skipFirstSelfPlay = True
+        # examples based on the model were already collected (loaded)
+        self.skipFirstSelfPlay = True
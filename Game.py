@@ -1,3 +1,6 @@
+import numpy as np
+
+
 class Game():
     """
     This class specifies the base Game class. To define your own game, subclass
@@ -13,10 +16,20 @@ class Game():
     getBoardSize(self): Restituisce le dimensioni del tabellone come una tupla di valori (x, y).
     getActionSize(self): Restituisce il numero di tutte le possibili azioni.
     getNextState(self, board, player, action): Restituisce lo stato successivo del tabellone dopo che un giocatore ha effettuato un'azione.
+    getNextStates(self, board, player, action): Restituisce tutti gli stati successivi possibili di un'azione con esito casuale, ognuno con la sua probabilità.
     getValidMoves(self, board, player): Restituisce un vettore binario che indica le mosse valide per un determinato giocatore sul tabellone corrente.
+    getValidActions(self, board, player): Restituisce gli indici ordinati delle mosse valide, la forma sparsa di getValidMoves.
     getGameEnded(self, board, player): Restituisce lo stato del gioco, che può essere 0 se il gioco non è ancora finito, 1 se il giocatore ha vinto, -1 se il giocatore ha perso e un valore non nullo per una patta.
     getCanonicalForm(self, board, player): Restituisce la forma canonica del tabellone, che dovrebbe essere indipendente dal giocatore. 
+    getObservation(self, board): Restituisce l'input della rete neurale per un tabellone in forma canonica. Di default è il tabellone stesso.
+    getObservationBatch(self, boards): Come getObservation, ma per molti tabelloni canonici insieme, impilati in un array.
     getSymmetries(self, board, pi): Restituisce una lista di tuple contenenti forme simmetriche del tabellone e i corrispondenti vettori di policy. Questo metodo è utile durante l'addestramento della rete neurale.
+    getSymmetriesBatch(self, boards, pis): Come getSymmetries, ma per molti esempi insieme, impilati in array.
+    getSymmetryRepresentative(self, board): Restituisce la forma simmetrica scelta come rappresentante del tabellone e la simmetria che la produce, così che MCTS condivida le statistiche tra posizioni equivalenti.
+    getSymmetryActions(self, sym): Restituisce, per ogni azione della rappresentante, l'azione corrispondente del tabellone originale.
+    getStateKey(self, board, player): Restituisce la chiave di stringRepresentation della forma canonica del tabellone per il giocatore dato, senza doverla costruire quando il gioco lo permette.
+    getDeterminizations(self, board, k): Restituisce k tabelloni estratti tra quelli coerenti con ciò che il player1 del tabellone canonico osserva, per i giochi a informazione nascosta.
+    getInformationKey(self, board, player): Restituisce una chiave che dipende solo da ciò che il player1 del tabellone osserva e dal giocatore che deve muovere, così che MCTS condivida le statistiche tra i tabelloni estratti.
     stringRepresentation(self, board): Restituisce una rapida conversione del tabellone in un formato stringa, necessario per l'hashing utilizzato da algoritmi come MCTS (Monte Carlo Tree Search).
     """
     def __init__(self):
@@ -57,6 +70,22 @@ class Game():
         """
         pass
 
+    def getNextStates(self, board, player, action):
+        """
+        Input:
+            board: current board
+            player: current player (1 or -1)
+            action: action taken by current player
+
+        Returns:
+            outcomes: list of (nextBoard, nextPlayer, probability), one for
+                      every chance outcome of action. The default, right for
+                      deterministic games, is the single outcome of
+                      getNextState.
+        """
+        nextBoard, nextPlayer = self.getNextState(board, player, action)
+        return [(nextBoard, nextPlayer, 1.)]
+
     def getValidMoves(self, board, player):
         """
         Input:
@@ -70,6 +99,21 @@ class Game():
         """
         pass
 
+    def getValidActions(self, board, player):
+        """
+        Input:
+            board: current board
+            player: current player
+
+        Returns:
+            validActions: sorted integer array with the indices of the moves
+                          that are valid from the current board and player,
+                          i.e. the nonzero entries of getValidMoves. Games
+                          with large action spaces should override this to
+                          avoid building the dense vector.
+        """
+        return np.flatnonzero(self.getValidMoves(board, player))
+
     def getGameEnded(self, board, player):
         """
         Input:
@@ -99,6 +143,31 @@ class Game():
         """
         pass
 
+    def getObservation(self, board):
+        """
+        Input:
+            board: current board in its canonical form
+
+        Returns:
+            observation: the input of the neural network for board. Games
+                         whose canonical form is already a suitable input
+                         can keep this default, which returns board itself.
+        """
+        return board
+
+    def getObservationBatch(self, boards):
+        """
+        Input:
+            boards: canonical boards stacked along the first axis
+
+        Returns:
+            observations: getObservation of every board, stacked along the
+                          first axis. Games that can build the observations
+                          of many boards at once should override this
+                          default, which calls getObservation on every board.
+        """
+        return np.array([self.getObservation(board) for board in boards])
+
     def getSymmetries(self, board, pi):
         """
         Input:
@@ -112,6 +181,48 @@ class Game():
         """
         pass
 
+    def getSymmetriesBatch(self, boards, pis):
+        """
+        Input:
+            boards: B boards stacked along the first axis
+            pis: the B corresponding policy vectors, shape (B, getActionSize())
+
+        Returns:
+            boards, pis: the symmetrical forms of all the examples stacked
+                         along the first axis, the forms of every example one
+                         after the other. Every example must have the same
+                         number of forms. The default calls getSymmetries on
+                         every example.
+        """
+        forms = [form for board, pi in zip(boards, pis) for form in self.getSymmetries(board, pi)]
+        return np.array([b for b, _ in forms]), np.array([p for _, p in forms])
+
+    def getSymmetryRepresentative(self, board):
+        """
+        Input:
+            board: current board in its canonical form
+
+        Returns:
+            representative: the symmetrical form of board that stands for all
+                            of them; equivalent boards must get the same one
+            sym: the symmetry mapping board to representative, to be passed
+                 to getSymmetryActions. The default, for games without
+                 symmetries, returns (board, None).
+        """
+        return board, None
+
+    def getSymmetryActions(self, sym):
+        """
+        Input:
+            sym: a symmetry returned by getSymmetryRepresentative
+
+        Returns:
+            actions: integer array of size self.getActionSize() with, for every
+                     action of the representative, the corresponding action of
+                     the original board
+        """
+        pass
+
     def stringRepresentation(self, board):
         """
         Input:
@@ -122,3 +233,61 @@ class Game():
                          Required by MCTS for hashing.
         """
         pass
+
+    def getStateKey(self, board, player):
+        """
+        Input:
+            board: current board
+            player: current player (1 or -1)
+
+        Returns:
+            key: stringRepresentation of getCanonicalForm(board, player). Games
+                 that can compute it without building the canonical board
+                 (e.g. from a hash kept up to date by getNextState) should
+                 override this default, which builds it.
+        """
+        return self.stringRepresentation(self.getCanonicalForm(board, player))
+
+    def getDeterminizations(self, board, k):
+        """
+        Input:
+            board: current board in its canonical form
+            k: number of boards to sample
+
+        Returns:
+            boards: k boards sampled, with their posterior probability, among
+                    those consistent with what player 1 of board observes;
+                    e.g. the hidden pieces of a hidden information game are
+                    resampled. The default, for perfect information games,
+                    repeats board.
+        """
+        return [board] * k
+
+    def getDecidedAction(self, board, threshold):
+        """
+        Input:
+            board: current board in its canonical form
+            threshold: minimum probability that the action is right
+
+        Returns:
+            action: an action the player can take without searching, because
+                    the game can tell that it is right with probability at
+                    least threshold (e.g. declaring a hidden fact whose
+                    posterior is known), or None. The default never decides.
+        """
+        return None
+
+    def getInformationKey(self, board, player):
+        """
+        Input:
+            board: current board, in the frame of the player that observes it
+                   as player 1 (the player to move at the root of a search)
+            player: player to move (1 or -1)
+
+        Returns:
+            key: a key of the information set of player 1 of board with player
+                 to move: boards that player 1 cannot tell apart must get the
+                 same key. The default, for perfect information games, is
+                 getStateKey.
+        """
+        return self.getStateKey(board, player)
@@ -0,0 +1,190 @@
+import logging
+import multiprocessing as mp
+import queue
+import threading
+import time
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+class InferenceStats():
+    """
+    Batch-fill and queue-latency statistics collected by an InferenceServer.
+    """
+
+    def __init__(self, maxBatchSize):
+        self.maxBatchSize = maxBatchSize
+        self.batches = 0  # forward passes run
+        self.requests = 0  # client requests served
+        self.boards = 0  # boards evaluated
+        self.filled = 0  # boards evaluated, at most maxBatchSize per pass
+        self.latencySum = 0.  # seconds spent by the requests in the queue
+        self.latencyMax = 0.
+
+    def __repr__(self):
+        return (f'batches={self.batches} requests={self.requests} boards={self.boards} '
+                f'fill={self.meanFill():.2f} latency={1000 * self.meanLatency():.2f}ms '
+                f'(max {1000 * self.latencyMax:.2f}ms)')
+
+    def update(self, boards, latencies):
+        self.batches += 1
+        self.requests += len(latencies)
+        self.boards += boards
+        self.filled += min(boards, self.maxBatchSize)
+        self.latencySum += sum(latencies)
+        self.latencyMax = max(self.latencyMax, max(latencies))
+
+    def meanFill(self):
+        """
+        Average fraction of maxBatchSize used by a forward pass, between 0
+        and 1. A single request larger than maxBatchSize is served alone and
+        counts as a full pass.
+        """
+        return self.filled / (self.batches * self.maxBatchSize) if self.batches else 0.
+
+    def meanLatency(self):
+        """Average time a request waited before its forward pass started."""
+        return self.latencySum / self.requests if self.requests else 0.
+
+
+class InferenceClient():
+    """
+    Stand-in for a NeuralNet that sends its boards to an InferenceServer and
+    waits for the answer. It only implements predict and predict_batch, which
+    is all MCTS needs.
+
+    Clients are created by InferenceServer.start and can be handed to worker
+    processes when they are started (e.g. as Pool initargs).
+    """
+
+    def __init__(self, clientId, requests, responses):
+        self.clientId = clientId
+        self.requests = requests
+        self.responses = responses
+
+    def predict(self, board):
+        pis, vs = self.predict_batch(np.asarray(board)[np.newaxis])
+        return pis[0], vs[0]
+
+    def predict_batch(self, boards):
+        self.requests.put((self.clientId, np.asarray(boards, dtype=np.float32), time.time()))
+        return self.responses.get()
+
+
+class InferenceServer():
+    """
+    Evaluates the boards of many concurrent MCTS searches with one copy of the
+    network, batching their requests dynamically: a forward pass starts as
+    soon as maxBatchSize boards are waiting, or maxWait seconds after the
+    first of them arrived.
+
+    The server runs in a thread of the current process when it is given a
+    network, or in a local subprocess that loads nnetClass from a checkpoint,
+    so that the clients never need to load the network themselves.
+    """
+
+    def __init__(self, nnet=None, game=None, nnetClass=None, checkpoint=None,
+                 maxBatchSize=64, maxWait=0.002):
+        """
+        Input:
+            nnet: network to serve from a thread of this process
+            game, nnetClass, checkpoint: used instead of nnet to build the
+                network in a subprocess, loading it from the (folder,
+                filename) checkpoint
+            maxBatchSize: number of boards that triggers a forward pass
+            maxWait: seconds a request may wait for the batch to fill up
+        """
+        assert (nnet is None) != (nnetClass is None)
+        self.nnet = nnet
+        self.game = game
+        self.nnetClass = nnetClass
+        self.checkpoint = checkpoint
+        self.maxBatchSize = maxBatchSize
+        self.maxWait = maxWait
+        self.stats = InferenceStats(maxBatchSize)
+        self.worker = None
+
+    def start(self, numClients, ctx=None):
+        """
+        Starts serving and returns numClients InferenceClient, one for each
+        thread or process that will query the server concurrently.
+        """
+        ctx = ctx or mp.get_context('spawn')
+        self.requests = ctx.Queue()
+        self.statsQueue = ctx.Queue()
+        clients = [InferenceClient(i, self.requests, ctx.Queue()) for i in range(numClients)]
+        responses = [c.responses for c in clients]
+        if self.nnet is not None:
+            self.worker = threading.Thread(target=self.serve, args=(self.nnet, responses), daemon=True)
+        else:
+            self.worker = ctx.Process(target=_serveFromCheckpoint, daemon=True,
+                                      args=(self.game, self.nnetClass, self.checkpoint, self.maxBatchSize,
+                                            self.maxWait, self.requests, responses, self.statsQueue))
+        self.worker.start()
+        return clients
+
+    def stop(self):
+        """
+        Stops the server once the pending requests are served.
+
+        Returns:
+            stats: the InferenceStats of the whole run
+        """
+        self.requests.put(None)
+        if self.nnet is None:
+            self.stats = self.statsQueue.get()
+        self.worker.join()
+        self.worker = None
+        log.info(f'Inference server: {self.stats}')
+        return self.stats
+
+    def serve(self, nnet, responses):
+        """
+        Serving loop: collects requests into batches, runs them through
+        nnet.predict_batch and sends every client its own slice of the result.
+        A request that does not fit in the current batch is carried over to
+        the next one, so that a batch never exceeds maxBatchSize boards unless
+        a single request does. Returns when stop is called.
+        """
+        carried = []
+        while True:
+            item = carried.pop() if carried else self.requests.get()
+            if item is None:
+                break
+            batch = [item]
+            size = len(item[1])
+            deadline = time.time() + self.maxWait
+            while size < self.maxBatchSize:
+                try:
+                    item = self.requests.get(timeout=max(deadline - time.time(), 0))
+                except queue.Empty:
+                    break
+                if item is None or size + len(item[1]) > self.maxBatchSize:
+                    carried.append(item)
+                    break
+                batch.append(item)
+                size += len(item[1])
+
+            start = time.time()
+            pis, vs = nnet.predict_batch(np.concatenate([boards for _, boards, _ in batch]))
+            self.stats.update(size, [start - t for _, _, t in batch])
+
+            i = 0
+            for clientId, boards, _ in batch:
+                j = i + len(boards)
+                responses[clientId].put((pis[i:j], vs[i:j]))
+                i = j
+
+
+def _serveFromCheckpoint(game, nnetClass, checkpoint, maxBatchSize, maxWait, requests, responses, statsQueue):
+    """
+    Entry point of the subprocess started by InferenceServer.start.
+    """
+    nnet = nnetClass(game)
+    nnet.load_checkpoint(folder=checkpoint[0], filename=checkpoint[1])
+    server = InferenceServer(nnet=nnet, maxBatchSize=maxBatchSize, maxWait=maxWait)
+    server.requests = requests
+    server.serve(nnet, responses)
+    statsQueue.put(server.stats)
@@ -3,6 +3,8 @@ import math
 
 import numpy as np
 
+from NodeTable import NodeTable
+
 EPS = 1e-8
 
 log = logging.getLogger(__name__)
@@ -17,28 +19,71 @@ class MCTS():
         self.game = game
         self.nnet = nnet
         self.args = args
-        self.Qsa = {}  # stores Q values for s,a (as defined in the paper)
-        self.Nsa = {}  # stores #times edge s,a was visited
-        self.Ns = {}  # stores #times board s was visited
-        self.Ps = {}  # stores initial policy (returned by neural net)
-
-        self.Es = {}  # stores game.getGameEnded ended for board s
-        self.Vs = {}  # stores game.getValidMoves for board s
+        # stores, for every visited board s, game.getGameEnded and, if s was
+        # expanded, the initial policy P (returned by neural net), the visit
+        # counts N and the backed up values W of its valid actions
+        # with a node budget a search step adds at most one node per
+        # simulation before the tree is pruned again, see getActionProb
+        maxNodes = None
+        if args.get('mctsMaxNodes', 0):
+            maxNodes = args.mctsMaxNodes + max(args.get('mctsBatchSize', 1), 1)
+        self.nodes = NodeTable(chance=args.get('mctsChance', False), maxNodes=maxNodes)
+        # the representative of a determinization depends on its hidden part
+        assert not (args.get('mctsInformationSet', False) and args.get('symmetricMCTS', False)), \
+            "mctsInformationSet cannot be combined with symmetricMCTS"
 
     def getActionProb(self, canonicalBoard, temp=1):
         """
         This function performs numMCTSSims simulations of MCTS starting from
         canonicalBoard.
 
+        With args.guessThreshold, an action the game decides on its own with
+        at least that probability (game.getDecidedAction) is played without
+        searching.
+
         Returns:
             probs: a policy vector where the probability of the ith action is
-                   proportional to Nsa[(s,a)]**(1./temp)
+                   proportional to N(s,a)**(1./temp)
         """
-        for i in range(self.args.numMCTSSims):
-            self.search(canonicalBoard)
-
-        s = self.game.stringRepresentation(canonicalBoard)
-        counts = [self.Nsa[(s, a)] if (s, a) in self.Nsa else 0 for a in range(self.game.getActionSize())]
+        if self.args.get('guessThreshold', 0):
+            action = self.game.getDecidedAction(canonicalBoard, self.args.guessThreshold)
+            if action is not None:
+                probs = [0] * self.game.getActionSize()
+                probs[action] = 1
+                return probs
+
+        canonicalBoard, _, sym = self.representative(canonicalBoard, 1)
+        s = self.stateKey(canonicalBoard, 1)
+        if self.args.get('mctsReroot', False):
+            # keep only the subtree of the new root, the rest of the tree can
+            # no longer be reached
+            self.nodes.reroot(self.nodes.find(s))
+
+        roots = self.roots(canonicalBoard)
+        batchSize = self.args.get('mctsBatchSize', 1)
+        maxNodes = self.args.get('mctsMaxNodes', 0)
+        sims = 0
+        while sims < self.args.numMCTSSims:
+            if batchSize > 1:
+                k = min(batchSize, self.args.numMCTSSims - sims)
+                sims += self.searchBatch(canonicalBoard, k, roots[sims:sims + k])
+            else:
+                self.search(roots[sims])
+                sims += 1
+            if maxNodes and len(self.nodes) > maxNodes:
+                # over budget: keep the half of the nodes closest to the root
+                self.nodes.reroot(self.nodes.find(s), maxNodes // 2)
+
+        node = self.nodes.find(s)
+        start, end = self.nodes.edges(node)
+        counts = np.zeros(self.game.getActionSize(), dtype=np.int64)
+        counts[self.nodes.actions[start:end]] = self.nodes.N[start:end]
+        if sym is not None:
+            # back from the actions of the representative to those of the board
+            symCounts = counts
+            counts = np.zeros_like(symCounts)
+            counts[self.game.getSymmetryActions(sym)] = symCounts
+        counts = counts.tolist()
 
         if temp == 0:
             bestAs = np.array(np.argwhere(counts == np.max(counts))).flatten()
@@ -52,16 +97,47 @@ class MCTS():
         probs = [x / counts_sum for x in counts]
         return probs
 
-    '''def search(self, canonicalBoard):
+    def roots(self, canonicalBoard):
+        """
+        With args.mctsInformationSet the search never looks at what the player
+        to move at the root cannot see: every simulation starts from its own
+        determinization, a board sampled by game.getDeterminizations among
+        those consistent with the player's observations, and nodes are looked
+        up with game.getInformationKey, so all the determinizations share one
+        tree (single observer information set MCTS).
+
+        Returns:
+            roots: the numMCTSSims boards the simulations start from, all
+                   canonicalBoard without args.mctsInformationSet
+        """
+        if not self.args.get('mctsInformationSet', False):
+            return [canonicalBoard] * self.args.numMCTSSims
+        return self.game.getDeterminizations(canonicalBoard, self.args.numMCTSSims)
+
+    def stateKey(self, board, player):
+        """
+        Returns:
+            s: the key of the node of board with player to move, see roots
+        """
+        if self.args.get('mctsInformationSet', False):
+            return self.game.getInformationKey(board, player)
+        return self.game.getStateKey(board, player)
+
+    def search(self, board, player=1, parentEdge=-1):
         """
         This function performs one iteration of MCTS. It is recursively called
         till a leaf node is found. The action chosen at each node is one that
         has the maximum upper confidence bound as in the paper.
 
+        The board is passed together with the player to move, and nodes are
+        looked up with stateKey: the canonical board is only built
+        when the network has to evaluate a new leaf. parentEdge is the edge
+        that led to board, linked to its node.
+
         Once a leaf node is found, the neural network is called to return an
         initial policy P and a value v for the state. This value is propagated
         up the search path. In case the leaf node is a terminal state, the
-        outcome is propagated up the search path. The values of Ns, Nsa, Qsa are
+        outcome is propagated up the search path. The values of Ns, N, W are
         updated.
 
         NOTE: the return values are the negative of the value of the current
@@ -69,153 +145,293 @@ class MCTS():
         state for the current player, then its value is -v for the other player.
 
         Returns:
-            v: the negative of the value of the current canonicalBoard
+            v: the negative of the value of the current board for player
         """
 
-        s = self.game.stringRepresentation(canonicalBoard)
-        # print(canonicalBoard)
+        board, player, _ = self.representative(board, player)
+        s = self.stateKey(board, player)
 
-        if s not in self.Es:
-            self.Es[s] = self.game.getGameEnded(canonicalBoard, 1)
-        if self.Es[s] != 0:
-            # terminal node
-            return -self.Es[s]
+        node = self.nodes.find(s)
+        if node < 0:
+            ended = self.game.getGameEnded(board, player)
+            if ended != 0:
+                # terminal node
+                node = self.nodes.add(s, ended)
+                if parentEdge >= 0:
+                    self.nodes.link(parentEdge, node)
+                return -ended
 
-        if s not in self.Ps:
             # leaf node
-            self.Ps[s], v = self.nnet.predict(canonicalBoard)
-            valids = self.game.getValidMoves(canonicalBoard, 1)
-            self.Ps[s] = self.Ps[s] * valids  # masking invalid moves
-            sum_Ps_s = np.sum(self.Ps[s])
-            if sum_Ps_s > 0:
-                self.Ps[s] /= sum_Ps_s  # renormalize
-            else:
-                # if all valid moves were masked make all valid moves equally probable
-
-                # NB! All valid moves may be masked if either your NNet architecture is insufficient or you've get overfitting or something else.
-                # If you have got dozens or hundreds of these messages you should pay attention to your NNet and/or training process.   
-                log.error("All valid moves were masked, doing a workaround.")
-                self.Ps[s] = self.Ps[s] + valids
-                self.Ps[s] /= np.sum(self.Ps[s])
-
-            self.Vs[s] = valids
-            self.Ns[s] = 0
+            canonicalBoard = self.game.getCanonicalForm(board, player)
+            ps, v = self.nnet.predict(self.game.getObservation(canonicalBoard))
+            node = self.expand(s, canonicalBoard, ps)
+            if parentEdge >= 0:
+                self.nodes.link(parentEdge, node)
             return -v
 
-        valids = self.Vs[s]
-        cur_best = -float('inf')
-        best_act = -1
-
-        # pick the action with the highest upper confidence bound
-        for a in range(self.game.getActionSize()):
-            if valids[a]:
-                if (s, a) in self.Qsa:
-                    u = self.Qsa[(s, a)] + self.args.cpuct * self.Ps[s][a] * math.sqrt(self.Ns[s]) / (
-                            1 + self.Nsa[(s, a)])
-                else:
-                    u = self.args.cpuct * self.Ps[s][a] * math.sqrt(self.Ns[s] + EPS)  # Q = 0 ?
-
-                if u > cur_best:
-                    cur_best = u
-                    best_act = a
+        if parentEdge >= 0:
+            self.nodes.link(parentEdge, node)
 
-        a = best_act
-        next_s, next_player = self.game.getNextState(canonicalBoard, 1, a)
-        next_s = self.game.getCanonicalForm(next_s, next_player)
+        if self.nodes.Es[node] != 0:
+            # terminal node
+            return -self.nodes.Es[node]
 
-        v = self.search(next_s)
+        e = self.selectEdge(node)
+        next_s, next_player, o = self.nextState(board, player, e)
 
-        if (s, a) in self.Qsa:
-            self.Qsa[(s, a)] = (self.Nsa[(s, a)] * self.Qsa[(s, a)] + v) / (self.Nsa[(s, a)] + 1)
-            self.Nsa[(s, a)] += 1
+        v = self.search(next_s, next_player, e)
 
-        else:
-            self.Qsa[(s, a)] = v
-            self.Nsa[(s, a)] = 1
+        self.update(node, e, v, o)
+        return -v
 
-        self.Ns[s] += 1
-        return -v'''
-    def search(self, canonicalBoard):
+    def searchBatch(self, canonicalBoard, batchSize, roots=None):
         """
-        This function performs one iteration of MCTS. It is recursively called
-        till a leaf node is found. The action chosen at each node is one that
-        has the maximum upper confidence bound as in the paper.
-
-        Once a leaf node is found, the neural network is called to return an
-        initial policy P and a value v for the state. This value is propagated
-        up the search path. In case the leaf node is a terminal state, the
-        outcome is propagated up the search path. The values of Ns, Nsa, Qsa are
-        updated.
-
-        NOTE: the return values are the negative of the value of the current
-        state. This is done since v is in [-1,1] and if v is the value of a
-        state for the current player, then its value is -v for the other player.
+        This function performs batchSize iterations of MCTS starting from
+        canonicalBoard, or from the boards roots if given (see roots),
+        evaluating all the leaves they reach with a single call to
+        nnet.predict_batch.
+
+        The descents are run one after the other before any value is known.
+        Every edge traversed by a pending descent carries a virtual loss: it
+        counts as an extra visit that was lost, so the following descents are
+        steered towards different leaves. Once the batch has been evaluated the
+        virtual losses are removed and the real values are backed up along
+        every path, exactly as search does.
 
         Returns:
-            v: the negative of the value of the current canonicalBoard
+            sims: the number of iterations performed (always batchSize)
         """
+        nodes = self.nodes
+        descents = []
+        leaves = {}  # leaf s -> canonical board to be evaluated
+        for i in range(batchSize):
+            path, s, board, ended = self.selectLeaf(canonicalBoard if roots is None else roots[i])
+            for node, e, _ in path:
+                nodes.VL[e] += 1
+                nodes.VLs[node] += 1
+            if ended == 0 and s not in leaves:
+                leaves[s] = board
+            descents.append((path, s, ended))
+
+        values = {}
+        if leaves:
+            keys = list(leaves)
+            pis, vs = self.nnet.predict_batch(self.game.getObservationBatch(np.array([leaves[s] for s in keys])))
+            for s, ps, v in zip(keys, pis, vs):
+                self.expand(s, leaves[s], ps)
+                values[s] = v
+
+        for path, s, ended in descents:
+            if path:
+                nodes.link(path[-1][1], nodes.find(s))
+            # value of the leaf for the player that moved into it
+            v = -ended if ended != 0 else -values[s]
+            for node, e, o in reversed(path):
+                nodes.VL[e] -= 1
+                nodes.VLs[node] -= 1
+                self.update(node, e, v, o)
+                v = -v
+        return batchSize
+
+    def selectLeaf(self, canonicalBoard):
+        """
+        Descends from canonicalBoard following selectEdge until a terminal
+        state or a state that has not been expanded yet is reached.
 
-        s = self.game.stringRepresentation(canonicalBoard)
-        # print(canonicalBoard)
-
-        if s not in self.Es:
-            self.Es[s] = self.game.getGameEnded(canonicalBoard, 1)
-        if self.Es[s] != 0:
-            # terminal node
-            return -self.Es[s]
-
-        if s not in self.Ps:
-            # leaf node
-            self.Ps[s], v = self.nnet.predict(canonicalBoard)
-            valids = self.game.getValidMoves(canonicalBoard, 1)
-            self.Ps[s] = self.Ps[s] * valids  # masking invalid moves
-            sum_Ps_s = np.sum(self.Ps[s])
-            if sum_Ps_s > 0:
-                self.Ps[s] /= sum_Ps_s  # renormalize
-            else:
-                # if all valid moves were masked make all valid moves equally probable
-
-                # NB! All valid moves may be masked if either your NNet architecture is insufficient or you've get overfitting or something else.
-                # If you have got dozens or hundreds of these messages you should pay attention to your NNet and/or training process.   
-                log.error("All valid moves were masked, doing a workaround.")
-                self.Ps[s] = self.Ps[s] + valids
-                self.Ps[s] /= np.sum(self.Ps[s])
+        Returns:
+            path: list of the (node, edge, outcome) traversed, see nextState
+            s: key of the reached state
+            board: canonical form of the reached state (its symmetry
+                   representative with args.symmetricMCTS) if it has to be
+                   expanded, else None
+            ended: game.getGameEnded of the reached state
+        """
+        path = []
+        board, player = canonicalBoard, 1
+        while True:
+            board, player, _ = self.representative(board, player)
+            s = self.stateKey(board, player)
+            node = self.nodes.find(s)
+            if node < 0:
+                ended = self.game.getGameEnded(board, player)
+                if ended != 0:
+                    self.nodes.add(s, ended)
+                    return path, s, None, ended
+                return path, s, self.game.getCanonicalForm(board, player), ended
+            if self.nodes.Es[node] != 0:
+                return path, s, None, self.nodes.Es[node]
+
+            e = self.selectEdge(node)
+            if path:
+                self.nodes.link(path[-1][1], node)
+            board, player, o = self.nextState(board, player, e)
+            path.append((node, e, o))
+
+    def nextState(self, board, player, e):
+        """
+        Plays the action of edge e. Without args.mctsChance the chance events
+        of the game (e.g. noisy answers) are sampled by game.getNextState.
+        With args.mctsChance the outcomes come from game.getNextStates and the
+        least visited one relative to its probability is followed, so the
+        visits of every outcome stay proportional to its probability.
 
-            self.Vs[s] = valids
-            self.Ns[s] = 0
-            return -v
+        Returns:
+            nextBoard, nextPlayer: as game.getNextState
+            o: the index of the outcome followed (0 or 1), or None if the
+               edge is not a chance edge
+        """
+        a = self.nodes.actions[e]
+        if not self.args.get('mctsChance', False):
+            return self.game.getNextState(board, player, a) + (None,)
+
+        outcomes = self.game.getNextStates(board, player, a)
+        if len(outcomes) == 1:
+            return outcomes[0][:2] + (None,)
+        assert len(outcomes) == 2, "MCTS supports at most two chance outcomes per action"
+        nodes = self.nodes
+        p0, p1 = outcomes[0][2], outcomes[1][2]
+        nodes.chanceP[e] = p0
+        # least visited outcome relative to its probability: N0/p0 vs N1/p1
+        o = 0 if nodes.N0[e] * p1 <= nodes.N1[e] * p0 else 1
+        return outcomes[o][:2] + (o,)
+
+    def representative(self, board, player):
+        """
+        With args.symmetricMCTS every state is replaced by its symmetry
+        representative (game.getSymmetryRepresentative) before it is looked
+        up, so equivalent states share one node and one network evaluation.
+        The whole tree then lives in the frame of the representatives: only
+        the root counts are mapped back to the actions of the real board.
 
-        valids = self.Vs[s]
-        cur_best = -float('inf')
-        best_act = -1
+        Returns:
+            board, player: the representative of the canonical form of board,
+                           with player 1, or board and player unchanged
+                           without args.symmetricMCTS
+            sym: the symmetry mapping the canonical form to the
+                 representative, or None
+        """
+        if not self.args.get('symmetricMCTS', False):
+            return board, player, None
+        representative, sym = self.game.getSymmetryRepresentative(self.game.getCanonicalForm(board, player))
+        return representative, 1, sym
 
-        # pick the action with the highest upper confidence bound
-        for a in range(self.game.getActionSize()):
-            if valids[a]:
-                if (s, a) in self.Qsa:
-                    u = self.Qsa[(s, a)] + self.args.cpuct * self.Ps[s][a] * math.sqrt(self.Ns[s]) / (
-                            1 + self.Nsa[(s, a)])
-                else:
-                    u = self.args.cpuct * self.Ps[s][a] * math.sqrt(self.Ns[s] + EPS)  # Q = 0 ?
+    def expand(self, s, canonicalBoard, ps):
+        """
+        Adds the leaf s to the tree, with the policy ps returned by the neural
+        network restricted to the valid actions of canonicalBoard and
+        renormalized.
 
-                if np.max(u) > cur_best:
-                    cur_best = np.max(u)
-                    best_act = a
+        Returns:
+            node: the id of s
+        """
+        actions = self.game.getValidActions(canonicalBoard, 1)
+        ps = ps[actions]  # masking invalid moves
+        sum_Ps_s = np.sum(ps)
+        if sum_Ps_s > 0:
+            ps /= sum_Ps_s  # renormalize
+        else:
+            # if all valid moves were masked make all valid moves equally probable
 
+            # NB! All valid moves may be masked if either your NNet architecture is insufficient or you've get overfitting or something else.
+            # If you have got dozens or hundreds of these messages you should pay attention to your NNet and/or training process.   
+            log.error("All valid moves were masked, doing a workaround.")
+            ps = ps + 1
+            ps /= np.sum(ps)
 
-        a = best_act
-        next_s, next_player = self.game.getNextState(canonicalBoard, 1, a)
-        next_s = self.game.getCanonicalForm(next_s, next_player)
+        return self.nodes.add(s, 0, actions, ps)
 
-        v = self.search(next_s)
+    def selectEdge(self, node):
+        """
+        Returns the edge of the expanded node with the highest upper
+        confidence bound, computed for all its valid actions at once. Ties go
+        to the lowest action. Edges with pending visits from searchBatch are
+        scored as if each pending visit had been lost.
+        """
+        nodes = self.nodes
+        start, end = nodes.edges(node)
+        ns = nodes.Ns[node] + nodes.VLs[node]
+        P = nodes.P[start:end]
+        vl = nodes.VL[start:end]
+        n = nodes.N[start:end] + vl
+        q = np.divide(nodes.W[start:end] - vl, n, out=np.zeros(end - start), where=n > 0)
+
+        # upper confidence bound of the visited edges and of the unvisited ones (Q = 0 ?)
+        u = np.where(n > 0, q + self.args.cpuct * P * math.sqrt(ns) / (1 + n),
+                     self.args.cpuct * P * math.sqrt(ns + EPS))
+        return start + int(np.argmax(u))
+
+    def update(self, node, e, v, o=None):
+        """
+        Backs up the value v, seen from the player to move in node, on its
+        edge e. If the value came through the chance outcome o of the edge,
+        W is set so that the edge's Q is the average of the outcome values
+        weighted by their probabilities, rather than by how often each
+        outcome happened to be visited.
+        """
+        nodes = self.nodes
+        nodes.N[e] += 1
+        nodes.Ns[node] += 1
+        if o is None:
+            nodes.W[e] += v
+            return
+
+        if o == 0:
+            nodes.N0[e] += 1
+            nodes.W0[e] += v
+        else:
+            nodes.N1[e] += 1
+            nodes.W1[e] += v
+        p0 = nodes.chanceP[e]
+        q = weight = 0.
+        if nodes.N0[e] > 0:
+            q += p0 * nodes.W0[e] / nodes.N0[e]
+            weight += p0
+        if nodes.N1[e] > 0:
+            q += (1 - p0) * nodes.W1[e] / nodes.N1[e]
+            weight += 1 - p0
+        nodes.W[e] = nodes.N[e] * q / weight
+
+
+class MCTSPlayer():
+    """
+    Player that plays the most visited action of an MCTS search (temp=0), for
+    use in the Arena. Unlike a lambda over an MCTS it can be sent to other
+    processes: the pickled copy drops the network and the search tree, and
+    rebuilds the network from its checkpoint the first time it is called.
+    """
 
-        if (s, a) in self.Qsa:
-            self.Qsa[(s, a)] = (self.Nsa[(s, a)] * self.Qsa[(s, a)] + v) / (self.Nsa[(s, a)] + 1)
-            self.Nsa[(s, a)] += 1
+    def __init__(self, game, nnet, args, checkpoint=None):
+        """
+        Input:
+            game: Game object
+            nnet: the neural network of the player
+            args: MCTS args
+            checkpoint: (folder, filename) holding the weights of nnet, needed
+                        only if the player is pickled
+        """
+        self.game = game
+        self.nnet = nnet
+        self.nnetClass = nnet.__class__
+        self.args = args
+        self.checkpoint = checkpoint
+        self.mcts = MCTS(game, nnet, args)
 
-        else:
-            self.Qsa[(s, a)] = v
-            self.Nsa[(s, a)] = 1
+    def __call__(self, canonicalBoard):
+        if self.nnet is None:
+            self.nnet = self.nnetClass(self.game)
+            self.nnet.load_checkpoint(folder=self.checkpoint[0], filename=self.checkpoint[1])
+            self.reset()
+        return np.argmax(self.mcts.getActionProb(canonicalBoard, temp=0))
 
-        self.Ns[s] += 1
-        return -v
\ No newline at end of file
+    def reset(self):
+        """
+        Discards the search tree.
+        """
+        self.mcts = MCTS(self.game, self.nnet, self.args) if self.nnet is not None else None
+
+    def __getstate__(self):
+        assert self.checkpoint is not None, "MCTSPlayer needs a checkpoint to be pickled"
+        state = self.__dict__.copy()
+        state['nnet'] = None
+        state['mcts'] = None
+        return state
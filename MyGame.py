@@ -1,25 +1,47 @@
 from Game import Game
-from MyLogic import Board
+from MyLogic import Board, Belief, PatternTable, Symmetries, PROB_RISPOSTA_CORRETTA
 
 import numpy as np
-import numpy.ma as ma
-import math
 
 class MyGame(Game):
     """ Questa classe specifica il Game. Questo Game è pensato per
     essere: two-player, adversarial and turn-based.
     Usa 1 per il player1 e -1 per il player2."""
 
-    def __init__(self, n):
+    def __init__(self, n, patternTables=None):
+        """
+        Input: la dimensione n della board e la cartella delle PatternTable
+        costruite da tables.py, None per non usarle
+        """
         self.n = n
+        # indici dei campi dello stato compatto (vedi Board.toState)
+        self.piecesIdx = slice(0, n*n)
+        self.mask1Idx = slice(n*n, 2*n*n)
+        self.mask2Idx = slice(2*n*n, 3*n*n)
+        self.info1Idx = slice(3*n*n, 5*n*n)
+        self.info2Idx = slice(5*n*n, 7*n*n)
+        self.guess1Idx = 7*n*n
+        self.guess2Idx = 7*n*n + 1
+        self.caseIdx = 7*n*n + 2
+        # hash dello stato e dello stato con i ruoli scambiati (vedi Zobrist)
+        self.hashIdx = slice(7*n*n + 3, 7*n*n + 11)
+        self.hashSwapIdx = slice(7*n*n + 11, 7*n*n + 19)
+        self.swap = Board.swapPermutation(n)
+        self.symmetries = Symmetries(n)
+        # la presenza del pattern nelle board piccole si legge nella tabella
+        # precalcolata, se è stata costruita
+        table = None
+        if patternTables is not None and n <= PatternTable.MAX_N:
+            table = PatternTable.load(patternTables, n)
+        self.belief = Belief(n, table=table)
 
     def getInitBoard(self):
         "Ritorna startBoard: una rappresentazione della board"
-        # ritorna la board iniziale, di tutti gli elementi inizializzati
-        # serve tenersi inizialmnte solo la board (di tipo numpy.array)
+        # ritorna la board iniziale, di tutti gli elementi inizializzati,
+        # nella forma compatta di Board.toState: la board non viene mai
+        # modificata, ogni mossa ne produce una nuova
         
-        self.b = Board(self.n)
-        return self.b.pieces
+        return Board(self.n).toState()
 
     def getBoardSize(self):
         "Ritorna (x,y): tupla che indica la dimensione della board"
@@ -43,21 +65,45 @@ class MyGame(Game):
         turno successivo (basta fare -player)
         """
         # player esegue l'azione sulla mask dell'avversario e sulle proprie info
-        # è però necessario, data la action, ricavare gli indici da passare come
-        # mossa, sempre nella forma (interrogazione, scoperta)
         # action must be a valid move and return (board, next player)
+
+        b = Board.fromState(self.n, board)
+        b.execute_move(self.getMove(action), player)
         
+        return (b.toState(), -player)
+
+    def getNextStates(self, board, player, action):
+        """
+        Input: board corrente, il player corrente (1 o -1) e l'azione
+
+        Ritorna tutti gli esiti possibili della mossa, come lista di
+        (board, nextPlayer, probabilità): un'interrogazione ha due esiti,
+        risposta corretta e risposta sbagliata, un guess uno solo.
+        """
+
+        move = self.getMove(action)
+        if action >= self.n**4:
+            return [self.getNextState(board, player, action) + (1.,)]
+
+        esiti = []
+        for corretta, p in ((True, PROB_RISPOSTA_CORRETTA), (False, 1 - PROB_RISPOSTA_CORRETTA)):
+            b = Board.fromState(self.n, board)
+            b.execute_move(move, player, corretta)
+            esiti.append((b.toState(), -player, p))
+        return esiti
+
+    def getMove(self, action):
+        """Ritorna la move di Board.execute_move corrispondente ad action"""
+        # è necessario, data la action, ricavare gli indici da passare come
+        # mossa, sempre nella forma (scoperta, interrogazione)
+
         if action < self.n**4:
-            move = ([action//self.n**3, (action%self.n**3)//self.n**2],
+            return ([action//self.n**3, (action%self.n**3)//self.n**2],
                 [(action%self.n**2)//self.n, action%self.n])
         elif action == self.n**4:
-            move = "guess_pattern"
+            return "guess_pattern"
         else:
-            move = "guess_nonpattern"
-
-        self.b.execute_move(move, player)
-        
-        return (board, -player)
+            return "guess_nonpattern"
 
     def getValidMoves(self, board, player):
         """
@@ -66,21 +112,37 @@ class MyGame(Game):
         Ritorna validMoves: un vettore binario di lunghezza self.getActionSize(),
         con 1 nel caso la mossa è valida, 0 altrimenti
         """
-        # invoca get_legal_moves e ritorna tutti i possibili casi ottenuti
+        # il vettore binario si costruisce a partire dagli indici ritornati
+        # da getValidActions
 
-        valids = [0]*self.getActionSize()
+        valids = np.zeros(self.getActionSize(), dtype=int)
+        valids[self.getValidActions(board, player)] = 1
 
-        legalMoves =  self.b.get_legal_moves(player)
+        return valids
 
-        # legalMoves contiene tutte le mosse valide, si deve in seguito
-        #trovare la posizione che deve occupare nel vettore binario valids
-        for (i,j),(h,k) in legalMoves[:-2]:
-            app = i*pow(self.n,3) + j*pow(self.n,2) + h*self.n + k
-            valids[app] = 1
-        valids[-1] = 1
-        valids[-2] = 1
+    def getValidActions(self, board, player):
+        """
+        Input: board e player (1 o -1) correnti
 
-        return np.array(valids)
+        Ritorna validActions: gli indici ordinati delle mosse valide, gli
+        stessi che sono a 1 nel vettore di getValidMoves
+        """
+        # come in Board.get_legal_moves, per il player1 la cella da scoprire
+        # è presa dalla mask2 e quella da interrogare dalla mask1, il
+        # contrario per il player2; l'azione (i,j),(h,k) ha indice
+        # (i*n + j)*n^2 + h*n + k, quindi tutte le coppie si ottengono come
+        # prodotto esterno degli indici piatti delle due maschere, già in
+        # ordine crescente
+
+        if player == 1:
+            scoperte = np.flatnonzero(board[self.mask2Idx] == 1)
+            interrogate = np.flatnonzero(board[self.mask1Idx] == 1)
+        else:
+            scoperte = np.flatnonzero(board[self.mask1Idx] == 1)
+            interrogate = np.flatnonzero(board[self.mask2Idx] == 1)
+        coppie = (scoperte[:, np.newaxis]*self.n**2 + interrogate).ravel()
+
+        return np.concatenate((coppie, [self.n**4, self.n**4 + 1]))
 
     def getGameEnded(self, board, player):
         """
@@ -89,6 +151,10 @@ class MyGame(Game):
         Ritorna r: 0 se game non è finito. 1 se il player vince,
         -1 se player perde,       
         """
+        guess1 = board[self.guess1Idx]
+        guess2 = board[self.guess2Idx]
+        case = board[self.caseIdx]
+
         # verificare se la casella self.guess1 è diversa da 0
         # se self.guess1 == 1 and self.case == 1
             # player1 vince -> return 1
@@ -98,77 +164,92 @@ class MyGame(Game):
             # altrimenti player2 vince -> return -1
         # non è stato fatto guess -> return 0
         
-        # print(self.b.pieces)
-        # print(self.b.guess1)
-        # print(self.b.guess2)
+        # il risultato è calcolato dal punto di vista del player1 e poi
+        # riportato a quello di player
 
-        if self.b.guess1 == self.b.case:
+        if guess1 == case:
             # vinto
-            return 1
-        elif self.b.guess1 == -self.b.case:
+            return player
+        elif guess1 == -case:
             # perso
-            return -1
+            return -player
         
         # lo stesso vale per il player2
-        if self.b.guess2 == self.b.case:
+        if guess2 == case:
             # vinto
-            return -1
-        elif self.b.guess2 == -self.b.case:
+            return -player
+        elif guess2 == -case:
             # perso
-            return 1
+            return player
         return 0
 
     def getCanonicalForm(self, board, player):
-
-
-
         """
         Input: board e player (1 o -1) correnti
 
         Ritorna la canonicalBoard: La canonical form deve essere indipendente
-        dal player ed equivale alla board su cui viene applicata la mask e le
-        info ottenute fino a quel punto.
+        dal player; per il player2 si scambiano i ruoli dei due player
+        (maschere, info e guess), così che chi deve muovere sia sempre il
+        player1 della board ritornata.
         """
         
         if player == 1:
-            # a self.pieces viene applicata la self.mask1 per limitare al player
-            # la visione delle tessere a lui concesse, poi si applica self.info1
-            # così da poter inserire anche le risposte ottenute fino ad ora
-
-            # si ricorda inoltre che il formato delle info è:
-            # board.info1[i][j][0] = bianco
-            # board.info1[i][j][1] = nero
-            mx = ma.masked_array(self.b.pieces, mask=self.b.mask1, dtype=float)
-            for i in range(self.n):
-                for j in range(self.n):
-                    if mx.mask[i][j] == True:
-                        # si delega il computo della stima legato alle informazioni
-                        # ottenute alla funzione stimaValore
-                        mx[i][j] = np.round(self.stimaValore(self.b.info1[i][j][0],
-                                    self.b.info1[i][j][1]), 3)
-        else:
-            # si effettua la stessa operazione per il player2
-            mx = ma.masked_array(self.b.pieces, mask=self.b.mask2, dtype=float)
-            for i in range(self.n):
-                for j in range(self.n):
-                    if mx.mask[i][j] == True:
-                        mx[i][j] = np.round(self.stimaValore(self.b.info2[i][j][0],
-                                    self.b.info2[i][j][1]), 3)
-        return mx.data
-    
-    def stimaValore(self, bianco, nero):
-        # la funzione che stima il peso delle informazioni ottenute è
-        # della forma 1-e^-((col1-col2)/1+|col1-col2|)
-        # al valore così ottenutosi aggiunge 0.5 che corrisponde all'incertezza
-        if nero == bianco:
-            # se il loro valore è uguale allora si ha completa incertezza
-            return 0.5
-        elif nero > bianco:
-            return 0.5 + (1-math.exp(-((nero-bianco)/(1+(np.abs(nero-bianco))))))/2
-        else:
-            # 1 - funzione perchè si deve ottenere l'inverso
-            return 1 - (0.5 + (1-math.exp(-((bianco-nero)/(1+(np.abs(bianco-nero))))))/2)
+            return board
+        return board[self.swap]
+
+    def getObservation(self, board):
+        """
+        Input: canonicalBoard
+
+        Ritorna l'input della rete neurale: la board su cui viene applicata
+        la mask e le info ottenute fino a quel punto dal player che deve
+        muovere.
+        """
+        # a pieces viene applicata la mask1 per limitare al player la visione
+        # delle tessere a lui concesse, poi al posto delle celle nascoste si
+        # mette la probabilità a posteriori che siano nere, date le risposte
+        # in info1 e il numero di celle nere (vedi Belief.marginals); le
+        # celle viste hanno probabilità esattamente 0 o 1
+
+        return self.belief.marginals(board[np.newaxis])[0].reshape((self.n, self.n))
+
+    def getObservationBatch(self, boards):
+        """
+        Input: B canonicalBoard impilate (B, stateSize)
+
+        Ritorna gli input della rete (B, n, n), come getObservation, con una
+        sola programmazione dinamica per tutte le board.
+        """
+
+        return self.belief.marginals(np.asarray(boards)).reshape((-1, self.n, self.n))
+
+    def getPatternProbability(self, board):
+        """
+        Input: canonicalBoard
+
+        Ritorna la probabilità a posteriori, per il player che deve muovere,
+        che la board contenga il pattern (vedi Belief.patternProbability).
+        """
+
+        return self.belief.patternProbability(board)
+
+    def getDecidedAction(self, board, threshold):
+        """
+        Input: canonicalBoard e la soglia
+
+        Ritorna l'azione di guess del pattern, o della sua assenza, se la sua
+        probabilità a posteriori (vedi getPatternProbability) è almeno
+        threshold, altrimenti None. Con le PatternTable la probabilità costa
+        poche letture della tabella, ed è ricordata per ogni insieme di
+        informazione.
+        """
 
+        p = self.getPatternProbability(board)
+        if p >= threshold:
+            return self.n**4
+        if 1 - p >= threshold:
+            return self.n**4 + 1
+        return None
 
     def getSymmetries(self, board, pi):
         """
@@ -178,32 +259,43 @@ class MyGame(Game):
         della board e del vettore pi corrispondente. Si usa quando si addestra la
         neural network attraverso gli esempi.
         """
-        # mirror, rotational
-        #print("OOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOO")
-        #print(pi)
-        
-        #print(len(pi))
-        #print( self.n**4+2)     
+        # mirror, rotational: le 8 simmetrie di Symmetries, la prima è
+        # l'identità
         assert(len(pi) == self.n**4+2)  # 2 per il guess
-        #print("cristo")
-        #print(self.n)
-        pi = pi[:9]
-        pi_board = np.reshape(pi, (self.n, self.n))
+        boards, pis = self.getSymmetriesBatch(np.asarray(board)[np.newaxis], np.asarray(pi)[np.newaxis])
+        return [(b, list(p)) for b, p in zip(boards, pis)]
 
+    def getSymmetriesBatch(self, boards, pis):
+        """
+        Input: B board (B, n, n) e i corrispondenti vettori delle policy (B, n^4+2)
 
+        Ritorna (boards, pis): le forme simmetriche di tutti gli esempi,
+        (8B, n, n) e (8B, n^4+2), le 8 di ogni esempio una dopo l'altra.
+        """
+
+        return self.symmetries.augment(boards, pis)
 
-        #print("mannaggia")
-        l = []
+    def getSymmetryRepresentative(self, board):
+        """
+        Input: canonicalBoard
+
+        Ritorna (rappresentante, sym): la forma simmetrica della board scelta
+        tra le 8 rotazioni e riflessioni (vedi Symmetries.representative) e
+        l'indice sym della simmetria che la produce.
+        """
 
-        for i in range(1, 5):
-            for j in [True, False]:
-                newB = np.rot90(board, i)
-                newPi = np.rot90(pi_board, i)
-                if j:
-                    newB = np.fliplr(newB)
-                    newPi = np.fliplr(newPi)
-                l += [(newB, list(newPi.ravel()) + [pi[-1]])]
-        return l
+        return self.symmetries.representative(board)
+
+    def getSymmetryActions(self, sym):
+        """
+        Input: una simmetria sym ritornata da getSymmetryRepresentative
+
+        Ritorna actions: per ogni azione della rappresentante, l'azione
+        corrispondente della board originale; le coppie (scoperta,
+        interrogata) seguono la simmetria, i guess restano uguali.
+        """
+
+        return self.symmetries.actions[sym]
 
     def stringRepresentation(self, board):
         """
@@ -212,5 +304,52 @@ class MyGame(Game):
         Ritorna boardString: una conversione rapida della board in formato stringa.
         Richiesto dalla MCTS per l'hashing.
         """
-        
-        return board.tostring()
+        # la chiave è l'hash di Zobrist a 64 bit che lo stato porta con sé,
+        # aggiornato da execute_move a ogni mossa (vedi getStateKey)
+
+        return board[self.hashIdx].tobytes()
+
+    def getStateKey(self, board, player):
+        """
+        Input: board e player (1 o -1) correnti
+
+        Ritorna la chiave della canonicalBoard di player, cioè
+        stringRepresentation(getCanonicalForm(board, player)), senza
+        costruire la canonicalBoard: lo stato porta anche l'hash dello stato
+        con i ruoli scambiati.
+        """
+
+        return board[self.hashIdx if player == 1 else self.hashSwapIdx].tobytes()
+
+    def getDeterminizations(self, board, k):
+        """
+        Input: canonicalBoard e il numero k di board da estrarre
+
+        Ritorna k board (k, stateSize) estratte tra quelle coerenti con ciò
+        che il player1 della canonicalBoard osserva: celle nascoste, risposte
+        ottenute dall'avversario e case sono estratti dalla distribuzione a
+        posteriori data dalle info1 e dal numero di celle nere (vedi Belief).
+        """
+
+        return self.belief.sample(board, k)
+
+    def getInformationKey(self, board, player):
+        """
+        Input: board e player (1 o -1) che deve muovere
+
+        Ritorna la chiave dell'insieme di informazione del player1 di board:
+        l'hash di Zobrist dello stato senza i campi che il player1 non vede
+        (le celle nascoste dalla mask1, le info2 e, finché la partita non è
+        finita, case), più un valore che distingue chi deve muovere. Tutte le
+        board di getDeterminizations hanno la chiave della board da cui sono
+        estratte.
+        """
+
+        z = Board.zobrist(self.n)
+        nascosti = [np.flatnonzero(board[self.mask1Idx]), np.arange(self.info2Idx.start, self.info2Idx.stop)]
+        if board[self.guess1Idx] == 0 and board[self.guess2Idx] == 0:
+            nascosti.append([self.caseIdx])
+        h = z.without(board, np.concatenate(nascosti))
+        if player == -1:
+            h ^= z.turno
+        return h.tobytes()
@@ -1,6 +1,622 @@
 import numpy as np
 import numpy.ma as ma
 import itertools
+import math
+import os
+
+
+class PatternSet():
+    """Insieme di polimini (template) da cercare su una o più board.
+
+    Ogni template è una lista di celle (riga, colonna). Un template è
+    presente se esiste una traslazione in cui tutte le sue celle sono nere:
+    per ogni cella si prende la board traslata e si fa l'AND, così un intero
+    batch di board (B, n, n) si controlla con poche operazioni vettoriali."""
+
+    def __init__(self, shapes, symmetries=False):
+        """shapes: lista di forme, ognuna come lista di celle (i,j) oppure
+        come matrice 0/1; con symmetries=True si aggiungono anche tutte le
+        rotazioni e riflessioni di ogni forma"""
+
+        self.templates = []
+        visti = set()
+        for shape in shapes:
+            if isinstance(shape, np.ndarray):
+                shape = np.argwhere(shape == 1).tolist()
+            varianti = [shape]
+            if symmetries:
+                varianti = []
+                celle = [tuple(c) for c in shape]
+                for _ in range(4):
+                    # rotazione di 90 gradi e riflessione orizzontale
+                    celle = [(j, -i) for i, j in celle]
+                    varianti += [celle, [(i, -j) for i, j in celle]]
+            for celle in varianti:
+                # si normalizza la forma perché inizi dalla cella (0,0)
+                i0 = min(i for i, _ in celle)
+                j0 = min(j for _, j in celle)
+                celle = tuple(sorted((i - i0, j - j0) for i, j in celle))
+                if celle not in visti:
+                    visti.add(celle)
+                    h = max(i for i, _ in celle) + 1
+                    w = max(j for _, j in celle) + 1
+                    self.templates.append((celle, (h, w)))
+
+    def exists(self, boards):
+        """Ritorna, per ogni board del batch (B, n, n), True se contiene almeno
+        uno dei template; con una sola board (n, n) ritorna un singolo bool"""
+
+        b = np.asarray(boards) == 1
+        single = b.ndim == 2
+        if single:
+            b = b[np.newaxis]
+        n, m = b.shape[1:]
+
+        found = np.zeros(len(b), dtype=bool)
+        for celle, (h, w) in self.templates:
+            if h > n or w > m:
+                continue
+            # acc[:, i, j] indica se il template traslato in (i,j) è tutto nero
+            acc = np.ones((len(b), n - h + 1, m - w + 1), dtype=bool)
+            for (i, j) in celle:
+                acc &= b[:, i:i + n - h + 1, j:j + m - w + 1]
+            found |= acc.any(axis=(1, 2))
+        return found[0] if single else found
+
+
+# probabilità che la risposta a un'interrogazione sia corretta
+PROB_RISPOSTA_CORRETTA = 0.7
+
+# pattern di almeno due celle adiacenti
+DOMINO = PatternSet([[(0, 0), (0, 1)]], symmetries=True)
+# pattern con forma di tetramino a S o Z, in orizzontale e in verticale
+SZ_TETROMINO = PatternSet([[(0, 1), (0, 2), (1, 0), (1, 1)]], symmetries=True)
+
+
+class Symmetries():
+    """Le 8 simmetrie (rotazioni e riflessioni) di una board n x n, come
+    permutazioni precalcolate: applicare una simmetria a una board, a uno
+    stato compatto o a un vettore di policy è un solo indicizzamento.
+
+    Tutte le permutazioni sono di tipo gather: nuovo[i] = vecchio[perm[i]].
+    La simmetria 0 è l'identità."""
+
+    def __init__(self, n):
+        self.n = n
+        nn = n*n
+        griglia = np.arange(nn).reshape((n, n))
+        celle = []
+        for r in range(4):
+            for rifletti in (False, True):
+                g = np.rot90(griglia, r)
+                celle.append((np.fliplr(g) if rifletti else g).ravel())
+        # cells[k]: per ogni cella della board trasformata, la cella d'origine
+        self.cells = np.array(celle)
+
+        # stati compatti: pieces e maschere permutano le celle, le info le
+        # coppie (bianco, nero) di ogni cella, guess e case restano fermi
+        S = Board.stateSize(n)
+        self.states = np.tile(np.arange(S), (8, 1))
+        for o in (0, nn, 2*nn):
+            self.states[:, o:o + nn] = o + self.cells
+        for o in (3*nn, 5*nn):
+            info = o + 2*self.cells[:, :, np.newaxis] + np.arange(2)
+            self.states[:, o:o + 2*nn] = info.reshape((8, 2*nn))
+
+        # azioni: la coppia (scoperta, interrogata) permuta entrambe le
+        # celle, le due azioni di guess restano ferme
+        A = nn*nn + 2
+        self.actions = np.tile(np.arange(A), (8, 1))
+        self.actions[:, :nn*nn] = (self.cells[:, :, np.newaxis]*nn +
+                                   self.cells[:, np.newaxis, :]).reshape((8, nn*nn))
+
+        # tabelle di Zobrist permutate: nella forma k il valore di state[j]
+        # finisce nella posizione inv[k, j], quindi l'hash della forma è
+        # quello di state con la riga inv[k, j] della tabella al posto della
+        # riga j; si tengono solo gli XOR tra le due righe, nulli dove la
+        # simmetria non sposta il campo (guess e case non si spostano mai).
+        # Le tabelle sono appiattite, (8, 7n^2 * valori), così che gli hash
+        # delle 8 forme siano un solo take con gli indici basi + state
+        z = Board.zobrist(n)
+        mobili = np.arange(7*nn)
+        valori = z.table.shape[1]
+        inv = np.argsort(self.states[:, :7*nn], axis=1)
+        self.deltaHash = (z.table[mobili] ^ z.table[inv]).reshape((8, -1))
+        self.deltaHashSwap = (z.table[z.swap[mobili]] ^ z.table[z.swap[inv]]).reshape((8, -1))
+        # i valori vanno da -1 in su, la colonna 0 della tabella è il -1
+        self.basi = mobili*valori + 1
+
+    def augment(self, boards, pis):
+        """Ritorna (boards, pis) con le 8 forme simmetriche di ogni esempio:
+        da boards (B, n, n) e pis (B, n^4+2) si ottengono (8B, n, n) e
+        (8B, n^4+2), con le 8 forme di ogni esempio una dopo l'altra nello
+        stesso ordine di self.cells. Ogni pi trasformato è un solo gather
+        con la permutazione delle azioni."""
+
+        boards = np.asarray(boards)
+        pis = np.asarray(pis)
+        B = len(boards)
+        boards = boards.reshape((B, -1))[:, self.cells]
+        pis = pis[:, self.actions]
+        return boards.reshape((8*B, self.n, self.n)), pis.reshape((8*B, -1))
+
+    def representative(self, state):
+        """Ritorna (rappresentante, k): tra le 8 forme simmetriche dello stato
+        compatto, quella con l'hash minimo, e la simmetria k tale che i campi
+        del rappresentante sono quelli di state[self.states[k]]. Forme
+        equivalenti hanno gli stessi 8 hash e quindi lo stesso rappresentante.
+
+        Gli hash delle forme non si ricalcolano da zero: partono da quelli
+        scritti in state (che devono essere aggiornati, vedi Board.toState) e
+        si correggono con le tabelle permutate deltaHash e deltaHashSwap;
+        della forma scelta si costruiscono solo i campi."""
+
+        z = Board.zobrist(self.n)
+        h, hs = z.read(state)
+        indici = self.basi + state[:len(self.basi)]
+        hashForme = h ^ np.bitwise_xor.reduce(self.deltaHash.take(indici, axis=1), axis=1)
+        k = int(np.argmin(hashForme))
+        rappresentante = state[self.states[k]]
+        if k:
+            hashSwap = hs ^ np.bitwise_xor.reduce(self.deltaHashSwap[k].take(indici))
+            z.write(rappresentante, hashForme[k], hashSwap)
+        return rappresentante, k
+
+
+class Zobrist():
+    """Tabelle di Zobrist degli stati compatti di una board n x n.
+
+    L'hash di uno stato è lo XOR di un valore casuale a 64 bit per ogni
+    posizione dello stato e per il valore che vi si trova; quando un campo
+    cambia bastano due XOR, uno per togliere il vecchio valore e uno per
+    aggiungere il nuovo. Ogni stato porta con sé due hash (vedi
+    Board.toState): il proprio e quello dello stato con i ruoli scambiati,
+    cioè della canonicalBoard del player2, così che la chiave di uno stato
+    sia pronta per entrambi i player senza costruire la canonicalBoard."""
+
+    def __init__(self, n):
+        nn = n*n
+        # i due hash seguono i campi dello stato
+        self.offset = 7*nn + 3
+        # seme fisso: le chiavi sono le stesse in tutti i processi
+        rng = np.random.default_rng(n)
+        # i valori vanno da -1 (guess e case) a n*n/2 (conteggi delle info)
+        self.table = rng.integers(0, 2**64, size=(self.offset, nn//2 + 2), dtype=np.uint64)
+        # valore aggiunto alle chiavi degli insiemi di informazione quando
+        # muove il player2 (vedi MyGame.getInformationKey)
+        self.turno = rng.integers(0, 2**64, dtype=np.uint64)
+        # posizione di ogni campo nello stato con i ruoli scambiati
+        self.swap = Board.swapPermutation(n)[:self.offset]
+        self.positions = np.arange(self.offset)
+
+    def hashes(self, states):
+        """Ritorna (hash, hashSwap) calcolati da zero per uno stato o per un
+        batch di stati (B, stateSize)"""
+
+        valori = states[..., :self.offset].astype(np.intp) + 1
+        h = np.bitwise_xor.reduce(self.table[self.positions, valori], axis=-1)
+        hs = np.bitwise_xor.reduce(self.table[self.swap, valori], axis=-1)
+        return h, hs
+
+    def read(self, states):
+        "Ritorna (hash, hashSwap) scritti negli stati, copiati"
+
+        h = states[..., self.offset:self.offset + 8].copy().view(np.uint64)[..., 0]
+        hs = states[..., self.offset + 8:self.offset + 16].copy().view(np.uint64)[..., 0]
+        return h, hs
+
+    def write(self, states, h, hs):
+        "Scrive negli stati gli hash (hash, hashSwap)"
+
+        states[..., self.offset:self.offset + 8] = np.asarray(h, dtype=np.uint64)[..., np.newaxis].view(np.int8)
+        states[..., self.offset + 8:self.offset + 16] = np.asarray(hs, dtype=np.uint64)[..., np.newaxis].view(np.int8)
+
+    def without(self, state, positions):
+        """Ritorna l'hash di state senza il contributo dei campi in
+        positions, come se quei campi non facessero parte dello stato"""
+
+        h, _ = self.read(state)
+        valori = state[positions].astype(np.intp) + 1
+        return h ^ np.bitwise_xor.reduce(self.table[positions, valori])
+
+    def delta(self, positions, vecchi, nuovi):
+        """Ritorna i due XOR (per hash e hashSwap) che aggiornano gli hash
+        quando i campi in positions passano dai valori vecchi ai nuovi"""
+
+        vecchi = np.asarray(vecchi) + 1
+        nuovi = np.asarray(nuovi) + 1
+        swap = self.swap[positions]
+        return (self.table[positions, vecchi] ^ self.table[positions, nuovi],
+                self.table[swap, vecchi] ^ self.table[swap, nuovi])
+
+    def update(self, states, rows, positions, vecchi, nuovi):
+        """Aggiorna gli hash delle righe rows (distinte) del batch states, in
+        cui i campi in positions sono passati dai valori vecchi ai nuovi"""
+
+        righe = states[rows]
+        h, hs = self.read(righe)
+        dh, dhs = self.delta(positions, vecchi, nuovi)
+        self.write(righe, h ^ dh, hs ^ dhs)
+        states[rows] = righe
+
+
+class PatternTable():
+    """Tabella precalcolata della presenza del pattern (vedi
+    Board.patternSet) in tutte le board n x n, pensata per le board piccole
+    (n <= 5).
+
+    Una board è identificata dalla sua maschera di bit, in cui il bit c è 1
+    se la cella c è nera; la tabella tiene un bit per ognuna delle 2^(n*n)
+    board (4 MB per n = 5), ed è salvata in un file .npy che si apre
+    memory-mapped, così che tutti i processi condividano le stesse pagine.
+    Leggere la presenza del pattern costa quindi un prodotto scalare e una
+    lettura, qualunque sia il pattern."""
+
+    # dimensione massima della board per cui si costruisce la tabella
+    MAX_N = 5
+
+    def __init__(self, n, bits):
+        """bits: i 2^(n*n) bit della tabella, impaccati in ordine little
+        endian (vedi np.packbits)"""
+
+        self.n = n
+        self.bits = bits
+        # valore del bit di ogni cella nella maschera della board
+        self.pesi = np.left_shift(1, np.arange(n*n), dtype=np.int64)
+
+    @staticmethod
+    def filename(folder, n):
+        return os.path.join(folder, f'pattern_{n}.npy')
+
+    @classmethod
+    def build(cls, n, folder, chunk=2**16):
+        """Costruisce la tabella delle board n x n e la salva in folder,
+        cercando il pattern in chunk board alla volta; le board di un chunk
+        sono estratte dai byte delle maschere come uint8 (chunk*64 byte)"""
+
+        nn = n*n
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        filename = cls.filename(folder, n)
+        bits = np.lib.format.open_memmap(filename + '.tmp', mode='w+', dtype=np.uint8,
+                                         shape=(max(2**nn//8, 1),))
+        for start in range(0, 2**nn, chunk):
+            maschere = np.arange(start, min(start + chunk, 2**nn), dtype='<i8')
+            pieces = np.unpackbits(maschere.view(np.uint8).reshape((-1, 8)), axis=1, bitorder='little')[:, :nn]
+            esiste = Board.patternSet(n).exists(pieces.reshape((-1, n, n)))
+            packed = np.packbits(esiste, bitorder='little')
+            bits[start//8:start//8 + len(packed)] = packed
+        bits.flush()
+        del bits
+        os.replace(filename + '.tmp', filename)
+        return cls.load(folder, n)
+
+    @classmethod
+    def load(cls, folder, n):
+        """Ritorna la tabella delle board n x n salvata in folder,
+        memory-mapped, o None se non c'è"""
+
+        filename = cls.filename(folder, n)
+        if not os.path.isfile(filename):
+            return None
+        return cls(n, np.load(filename, mmap_mode='r'))
+
+    def index(self, pieces):
+        "Ritorna le maschere di bit delle board (B, n*n)"
+
+        return pieces.astype(np.int64) @ self.pesi
+
+    def lookupIndex(self, maschere):
+        "Ritorna True per le board, date come maschere di bit, con il pattern"
+
+        return (self.bits[maschere >> 3] >> (maschere & 7)) & 1 == 1
+
+    def lookup(self, pieces):
+        "Ritorna, per ogni board (B, n*n), True se contiene il pattern"
+
+        return self.lookupIndex(self.index(pieces))
+
+
+class Belief():
+    """Ciò che il player1 di uno stato compatto può sapere delle celle che
+    non vede (quelle con mask1 a 1).
+
+    Ogni risposta in info1 è corretta con probabilità PROB_RISPOSTA_CORRETTA,
+    quindi una cella con b risposte nero e w bianco è nera con verosimiglianza
+    relativa r = (p/(1-p))^(b-w); inoltre la board contiene esattamente
+    n_black celle nere. Ogni disposizione della board ha quindi peso pari al
+    prodotto, su tutte le celle, del peso della cella per il suo colore: 1 e
+    r per una cella nascosta (bianca, nera), 1 e 0 per una bianca vista, 0 e
+    1 per una nera vista. Le somme di questi pesi su tutte le disposizioni
+    con un dato numero di nere (polinomi simmetrici elementari) si calcolano
+    con una programmazione dinamica cella per cella, che dà sia le
+    probabilità a posteriori esatte di ogni cella sia un campionamento esatto
+    delle disposizioni, per un intero batch di stati insieme; per un solo
+    stato le probabilità si ottengono più in fretta raggruppando le celle con
+    gli stessi pesi (vedi classMarginals)."""
+
+    def __init__(self, n, maxEnumerate=20000, numSamples=1000, maxCache=100000, table=None):
+        """maxEnumerate: numero massimo di disposizioni delle celle nascoste
+        enumerate per calcolare esattamente la probabilità del pattern, oltre
+        la quale la si stima su numSamples disposizioni estratte; maxCache:
+        numero massimo di probabilità del pattern, e di marginali, tenute in
+        memoria; table: la PatternTable delle board n x n, se c'è, in cui
+        leggere la presenza del pattern invece di cercarlo"""
+
+        self.n = n
+        self.n_black = int(np.ceil(n*n*0.22))
+        # r per ogni differenza b-w possibile, da -n*n/2 a n*n/2
+        m = (n*n)//2
+        self.rapporti = (PROB_RISPOSTA_CORRETTA/(1 - PROB_RISPOSTA_CORRETTA))**np.arange(-m, m + 1)
+        self.maxEnumerate = maxEnumerate
+        self.numSamples = numSamples
+        self.maxCache = maxCache
+        self.cache = {}
+        self.cacheMarginali = {}  # key(state) -> marginals di state
+        self.scelte = {}  # (h, k) -> choices(h, k)
+        self.table = table
+        # binomiali[m, k] = C(m, k), per i polinomi delle classi di celle
+        self.binomiali = np.array([[math.comb(m, k) for k in range(self.n_black + 1)]
+                                   for m in range(n*n + 1)], dtype=float)
+
+    def weights(self, states):
+        """Ritorna i pesi (B, n*n, 2) (bianca, nera) di ogni cella degli stati
+        (B, stateSize), vedi la docstring della classe"""
+
+        nn = self.n*self.n
+        nascoste = states[:, nn:2*nn] == 1
+        info1 = states[:, 3*nn:5*nn].reshape((-1, nn, 2)).astype(int)
+        r = self.rapporti[info1[:, :, 1] - info1[:, :, 0] + (nn//2)]
+        nera = states[:, :nn] == 1
+        pesi = np.empty(nascoste.shape + (2,))
+        pesi[:, :, 0] = np.where(nascoste, 1, ~nera)
+        pesi[:, :, 1] = np.where(nascoste, r, nera)
+        return pesi
+
+    def suffixTable(self, pesi):
+        """Ritorna la tabella E (B, n*n+1, n_black+1) in cui E[:, i, j] è
+        proporzionale alla somma, su tutti i modi di colorare le celle
+        i..n*n-1 con j nere, del prodotto dei loro pesi. Ogni riga è
+        normalizzata al proprio massimo per non andare in overflow: i
+        rapporti tra gli elementi di una stessa riga, gli unici che servono,
+        non cambiano."""
+
+        B, nn, _ = pesi.shape
+        E = np.zeros((B, nn + 1, self.n_black + 1))
+        E[:, nn, 0] = 1
+        for i in range(nn - 1, -1, -1):
+            E[:, i] = pesi[:, i, :1]*E[:, i + 1]
+            E[:, i, 1:] += pesi[:, i, 1:]*E[:, i + 1, :-1]
+            E[:, i] /= E[:, i].max(axis=1, keepdims=True)
+        return E
+
+    def prefixTable(self, pesi):
+        """Come suffixTable, ma F[:, i, j] somma sulle celle 0..i-1"""
+
+        B, nn, _ = pesi.shape
+        F = np.zeros((B, nn + 1, self.n_black + 1))
+        F[:, 0, 0] = 1
+        for i in range(nn):
+            F[:, i + 1] = pesi[:, i, :1]*F[:, i]
+            F[:, i + 1, 1:] += pesi[:, i, 1:]*F[:, i, :-1]
+            F[:, i + 1] /= F[:, i + 1].max(axis=1, keepdims=True)
+        return F
+
+    def marginals(self, states):
+        """Ritorna, per ogni cella degli stati (B, stateSize), la probabilità
+        a posteriori (B, n*n) che sia nera per il player1: esattamente 0 o 1
+        per le celle che vede. Le probabilità sono tenute in memoria per ogni
+        insieme di informazione e si calcolano solo per gli stati mai visti:
+        con classMarginals se è uno solo, con una sola dynamicMarginals per
+        tutto il batch se sono di più."""
+
+        chiavi = self.keys(states)
+        trovate = {c: self.cacheMarginali[c] for c in chiavi if c in self.cacheMarginali}
+        mancanti = [i for i, c in enumerate(chiavi) if c not in trovate]
+        if mancanti:
+            if len(self.cacheMarginali) + len(mancanti) > self.maxCache:
+                self.cacheMarginali.clear()
+            nuovi = states[mancanti]
+            nuovi = self.classMarginals(nuovi) if len(nuovi) == 1 else self.dynamicMarginals(nuovi)
+            for i, m in zip(mancanti, nuovi):
+                trovate[chiavi[i]] = self.cacheMarginali[chiavi[i]] = m
+        return np.array([trovate[c] for c in chiavi])
+
+    def classMarginals(self, states):
+        """Come marginals, ma calcolate sempre, stato per stato.
+
+        Le celle con gli stessi pesi (le bianche viste, le nere viste, le
+        nascoste con la stessa differenza b-w) formano una classe: le m celle
+        di una classe contribuiscono con il polinomio (w0 + w1 x)^m, i cui
+        coefficienti sono binomiali, e i prodotti si fanno classe per classe
+        invece che cella per cella. Le classi sono poche (le differenze b-w
+        distinte), quindi il costo quasi non dipende da n. I pesi di ogni
+        classe sono divisi per il maggiore dei due; se nonostante questo un
+        polinomio va in underflow, lo stato passa a dynamicMarginals."""
+
+        nn = self.n*self.n
+        K = self.n_black
+        nascoste = states[:, nn:2*nn] == 1
+        info1 = states[:, 3*nn:5*nn].reshape((-1, nn, 2)).astype(int)
+        # classe 0: bianca vista, 1: nera vista, 2 + b-w + nn/2: nascosta
+        codici = np.where(nascoste, info1[:, :, 1] - info1[:, :, 0] + nn//2 + 2, states[:, :nn] == 1)
+        uno = np.eye(1, K + 1)[0]
+        risultato = np.empty(codici.shape)
+        for b, c in enumerate(codici):
+            classi, inversa, m = np.unique(c, return_inverse=True, return_counts=True)
+            r = self.rapporti[np.maximum(classi - 2, 0)]
+            w0 = np.where(classi >= 2, np.minimum(1, 1/r), classi == 0)
+            w1 = np.where(classi >= 2, np.minimum(1, r), classi == 1)
+            Q = self.classPolynomials(w0, w1, m)
+            # prodotti delle classi prima e dopo di ognuna
+            prima = [uno]
+            for q in Q[:-1]:
+                prima.append(np.convolve(prima[-1], q)[:K + 1])
+            dopo = [uno]
+            for q in Q[:0:-1]:
+                dopo.append(np.convolve(dopo[-1], q)[:K + 1])
+            # coefficienti K e K-1 del prodotto delle altre celle, quello
+            # delle altre classi per le altre m-1 celle della classe
+            Q1 = self.classPolynomials(w0, w1, m - 1)
+            altre = [np.convolve(np.convolve(p, d)[:K + 1], q)[:K + 1] for p, d, q in zip(prima, dopo[::-1], Q1)]
+            altre = np.array(altre)
+            nera = w1*altre[:, K - 1]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                p = nera/(w0*altre[:, K] + nera)
+            if not np.isfinite(p).all():
+                p = self.dynamicMarginals(states[b:b + 1])[0]
+                inversa = np.arange(nn)
+            risultato[b] = p[inversa]
+        return risultato
+
+    def classPolynomials(self, w0, w1, m):
+        """Ritorna i polinomi (C, n_black+1) (w0 + w1 x)^m di C classi di
+        celle, troncati al grado n_black"""
+
+        k = np.arange(self.n_black + 1)
+        m = m[:, np.newaxis]
+        termini = self.binomiali[m, k]*w1[:, np.newaxis]**k*w0[:, np.newaxis]**np.maximum(m - k, 0)
+        return np.where(k <= m, termini, 0)
+
+    def dynamicMarginals(self, states):
+        """Come classMarginals, ma con la programmazione dinamica a prefissi
+        e suffissi cella per cella, per tutto il batch insieme"""
+
+        pesi = self.weights(states)
+        F = self.prefixTable(pesi)
+        # Er[:, i, j] = E[:, i, n_black - j]: le nere delle celle 0..i-1 e
+        # quelle delle celle i+1.. devono sommare a n_black
+        Er = self.suffixTable(pesi)[:, :, ::-1]
+        nera = pesi[:, :, 1]*(F[:, :-1, :-1]*Er[:, 1:, 1:]).sum(axis=2)
+        bianca = pesi[:, :, 0]*(F[:, :-1]*Er[:, 1:]).sum(axis=2)
+        return nera/(nera + bianca)
+
+    def samplePieces(self, state, k, rng=np.random):
+        """Ritorna k board (k, n*n) estratte con la loro probabilità a
+        posteriori tra quelle coerenti con ciò che il player1 di state
+        osserva: le celle viste restano uguali"""
+
+        pesi = self.weights(state[np.newaxis])[0]
+        E = self.suffixTable(pesi[np.newaxis])[0]
+        pieces = np.zeros((k, len(pesi)), dtype=state.dtype)
+        rimaste = np.full(k, self.n_black)
+        u = rng.random((len(pesi), k))
+        for i, (pBianca, pNera) in enumerate(pesi):
+            # probabilità che la cella sia nera date le nere ancora da mettere
+            pNera = pNera*np.where(rimaste > 0, E[i + 1][rimaste - 1], 0)
+            pBianca = pBianca*E[i + 1][rimaste]
+            nera = u[i]*(pNera + pBianca) < pNera
+            pieces[:, i] = nera
+            rimaste -= nera
+        return pieces
+
+    def sample(self, state, k, rng=np.random):
+        """Ritorna k stati (k, stateSize) estratti tra quelli coerenti con ciò
+        che il player1 di state osserva, con la loro probabilità a posteriori:
+        le celle nascoste sono estratte da samplePieces, le risposte ottenute
+        dal player2, che il player1 non conosce, sono estratte di nuovo date
+        le celle interrogate (che il player1 vede), e case e hash sono
+        ricalcolati."""
+
+        n = self.n
+        nn = n*n
+        states = np.tile(state, (k, 1))
+        states[:, :nn] = self.samplePieces(state, k, rng)
+
+        # risposte del player2: quante volte ha interrogato ogni cella è
+        # noto, quali risposte ha ottenuto no
+        info2 = states[:, 5*nn:7*nn].reshape((k, nn, 2)).astype(int)
+        totali = info2.sum(axis=2)
+        if totali.any():
+            corrette = rng.binomial(totali, PROB_RISPOSTA_CORRETTA)
+            neri = np.where(states[:, :nn] == 1, corrette, totali - corrette)
+            info2[:, :, 1] = neri
+            info2[:, :, 0] = totali - neri
+            states[:, 5*nn:7*nn] = info2.reshape((k, 2*nn))
+
+        states[:, 7*nn + 2] = np.where(Board.patternSet(n).exists(states[:, :nn].reshape((k, n, n))), 1, -1)
+        z = Board.zobrist(n)
+        z.write(states, *z.hashes(states))
+        return states
+
+    def key(self, state):
+        """Ritorna una chiave di ciò che il player1 di state sa della board:
+        le celle viste, la mask1 e le info1"""
+
+        return self.keys(state[np.newaxis])[0]
+
+    def keys(self, states):
+        """Ritorna la lista delle chiavi (vedi key) degli stati (B, stateSize)"""
+
+        nn = self.n*self.n
+        mask1 = states[:, nn:2*nn]
+        campi = np.concatenate((states[:, :nn]*(1 - mask1), mask1, states[:, 3*nn:5*nn]), axis=1)
+        return [riga.tobytes() for riga in campi]
+
+    def patternProbability(self, state, rng=np.random):
+        """Ritorna la probabilità a posteriori, per il player1 di state, che la
+        board contenga il pattern (vedi Board.patternSet). Si enumerano tutte
+        le disposizioni delle nere nelle celle nascoste, pesate come nella
+        docstring della classe, se sono al più maxEnumerate, altrimenti si
+        stima su numSamples disposizioni estratte; la presenza del pattern in
+        ogni disposizione viene da exists. Il risultato è tenuto in memoria
+        per ogni insieme di informazione."""
+
+        chiave = self.key(state)
+        if chiave in self.cache:
+            return self.cache[chiave]
+
+        n = self.n
+        nn = n*n
+        nascoste = np.flatnonzero(state[nn:2*nn])
+        nere = self.n_black - int(state[:nn][state[nn:2*nn] == 0].sum())
+        if math.comb(len(nascoste), nere) <= self.maxEnumerate:
+            x = self.choices(len(nascoste), nere)
+            viste = state[:nn]*(1 - state[nn:2*nn])
+            if self.table is not None:
+                # maschera di bit di ogni disposizione: le nere viste più
+                # quelle scelte tra le nascoste
+                maschere = self.table.index(viste[np.newaxis])[0] + x @ self.table.pesi[nascoste]
+                esiste = self.table.lookupIndex(maschere)
+            else:
+                pieces = np.tile(viste, (len(x), 1))
+                pieces[:, nascoste] = x
+                esiste = self.exists(pieces)
+            # pesi in scala logaritmica: ogni nera nascosta conta log r
+            logR = np.log(self.weights(state[np.newaxis])[0, nascoste, 1])
+            logW = x @ logR
+            w = np.exp(logW - logW.max())
+            p = float(w @ esiste / w.sum())
+        else:
+            p = float(self.exists(self.samplePieces(state, self.numSamples, rng)).mean())
+
+        if len(self.cache) >= self.maxCache:
+            self.cache.clear()
+        self.cache[chiave] = p
+        return p
+
+    def choices(self, h, k):
+        """Ritorna la matrice booleana (C(h, k), h) di tutti i modi di
+        scegliere k celle nere tra h, costruita una volta sola per ogni (h, k)"""
+
+        if (h, k) not in self.scelte:
+            scelte = np.array(list(itertools.combinations(range(h), k)), dtype=np.intp)
+            x = np.zeros((len(scelte), h), dtype=bool)
+            x[np.arange(len(scelte))[:, np.newaxis], scelte.reshape((len(scelte), k))] = True
+            self.scelte[(h, k)] = x
+        return self.scelte[(h, k)]
+
+    def exists(self, pieces):
+        """Ritorna, per ogni board (B, n*n), True se contiene il pattern:
+        letto nella PatternTable se c'è, altrimenti cercato"""
+
+        if self.table is not None:
+            return self.table.lookup(pieces)
+        return Board.patternSet(self.n).exists(pieces.reshape((-1, self.n, self.n)))
+
+
+# tabelle di Zobrist già costruite, per dimensione della board
+_ZOBRIST = {}
 
 
 class Board():
@@ -48,49 +664,134 @@ class Board():
         # -1 non pattern, 1 pattern
         self.case = self.existPattern()
 
+        # hash dello stato, poi aggiornati da execute_move (vedi Zobrist)
+        self.hash = self.hashSwap = np.uint64(0)
+        self.hash, self.hashSwap = Board.zobrist(self.n).hashes(self.toState())
+
     # aggiunge la sintassi [][] alla Board
     def __getitem__(self, index): 
         return self.pieces[index]
 
+    @staticmethod
+    def stateSize(n):
+        "Lunghezza dello stato compatto di una board n x n"
+
+        # campi più i due hash a 64 bit
+        return 7*n*n + 3 + 16
+
+    @staticmethod
+    def zobrist(n):
+        "Ritorna le tabelle di Zobrist, condivise, delle board n x n"
+
+        if n not in _ZOBRIST:
+            _ZOBRIST[n] = Zobrist(n)
+        return _ZOBRIST[n]
+
+    @staticmethod
+    def swapPermutation(n):
+        """Ritorna gli indici che, applicati allo stato compatto, scambiano i
+        ruoli dei due player (maschere, info, guess e i due hash)"""
+
+        nn = n*n
+        idx = np.arange(Board.stateSize(n))
+        perm = idx.copy()
+        perm[nn:2*nn], perm[2*nn:3*nn] = idx[2*nn:3*nn], idx[nn:2*nn]
+        perm[3*nn:5*nn], perm[5*nn:7*nn] = idx[5*nn:7*nn], idx[3*nn:5*nn]
+        perm[7*nn], perm[7*nn+1] = idx[7*nn+1], idx[7*nn]
+        o = 7*nn + 3
+        perm[o:o+8], perm[o+8:o+16] = idx[o+8:o+16], idx[o:o+8]
+        return perm
+
+    def toState(self):
+        """Ritorna lo stato compatto della board: un array int8 che contiene,
+        nell'ordine, pieces, mask1, mask2, info1, info2 (appiattiti), guess1,
+        guess2 e case, seguiti dai byte dei due hash di Zobrist (vedi
+        Zobrist). Le info stanno in un int8 perché ogni interrogazione
+        scopre una cella della maschera avversaria, quindi ogni player ne fa
+        al più n*n/2."""
+
+        state = np.concatenate((self.pieces.ravel(), self.mask1.ravel(),
+            self.mask2.ravel(), self.info1.ravel(), self.info2.ravel(),
+            [self.guess1, self.guess2, self.case], np.zeros(16))).astype(np.int8)
+        Board.zobrist(self.n).write(state, self.hash, self.hashSwap)
+        return state
+
+    @staticmethod
+    def batch(n, B, rng=None):
+        """Crea B board iniziali n x n in una volta sola, come stati compatti
+        (vedi toState) impilati in un array int8 (B, stateSize(n)) con pieces,
+        maschere ed etichetta case di ogni board. Tutta la casualità viene
+        dal np.random.Generator rng, quindi ogni worker con il proprio rng
+        ottiene board ripetibili."""
+
+        if rng is None:
+            rng = np.random.default_rng()
+        nn = n*n
+        n_black = int(np.ceil(nn*0.22))
+
+        states = np.zeros((B, Board.stateSize(n)), dtype=np.int8)
+        pieces = rng.permuted(np.tile(np.arange(nn) < n_black, (B, 1)), axis=1)
+        mask2 = rng.permuted(np.tile(np.arange(nn) < nn//2, (B, 1)), axis=1)
+        states[:, :nn] = pieces
+        states[:, nn:2*nn] = ~mask2
+        states[:, 2*nn:3*nn] = mask2
+        # info e guess restano a 0
+        states[:, 7*nn+2] = np.where(
+            Board.patternSet(n).exists(pieces.reshape((B, n, n))), 1, -1)
+        z = Board.zobrist(n)
+        z.write(states, *z.hashes(states))
+        return states
+
+    @classmethod
+    def fromState(cls, n, state):
+        """Ricostruisce una board dallo stato compatto ritornato da toState.
+        La board ottenuta lavora su una copia, quindi execute_move non
+        modifica state."""
+
+        nn = n*n
+        b = cls.__new__(cls)
+        b.n = n
+        b.n_black = int(np.ceil(n*n*0.22))
+        b.pieces = state[:nn].reshape((n,n)).astype(int)
+        b.mask1 = state[nn:2*nn].reshape((n,n)).astype(int)
+        b.mask2 = state[2*nn:3*nn].reshape((n,n)).astype(int)
+        b.info1 = state[3*nn:5*nn].reshape((n,n,2)).astype(int)
+        b.info2 = state[5*nn:7*nn].reshape((n,n,2)).astype(int)
+        b.guess1, b.guess2, b.case = (int(x) for x in state[7*nn:7*nn+3])
+        b.hash, b.hashSwap = Board.zobrist(n).read(state)
+        return b
+
+    def updateHash(self, position, vecchio, nuovo):
+        """Aggiorna gli hash quando il campo in position dello stato compatto
+        passa dal valore vecchio al nuovo"""
+
+        dh, dhs = Board.zobrist(self.n).delta(position, vecchio, nuovo)
+        self.hash ^= dh
+        self.hashSwap ^= dhs
+
+    @staticmethod
+    def patternSet(n):
+        "Ritorna il PatternSet cercato su una board n x n"
+
+        if(n < 6):
+            return DOMINO
+        else:
+            return SZ_TETROMINO
+
     def existPattern(self):
         "Gestisce i due possibili casi di pattern analizzati"
 
-        if(self.n < 6):
-            return self.checkPattern2()
-        else:
-            return self.checkPattern4()
+        return 1 if Board.patternSet(self.n).exists(self.pieces) else -1
 
     def checkPattern2(self):
         "Pattern di almeno due celle adiacenti"
 
-        for i in range(self.n):
-            for j in range(self.n):
-                if j < self.n - 1:
-                    if self.pieces[i][j] == 1 and self.pieces[i][j+1] == 1:
-                        return 1
-                if i < self.n - 1:
-                    if self.pieces[i][j] == 1 and self.pieces[i+1][j] == 1:
-                        return 1
-        return -1
+        return 1 if DOMINO.exists(self.pieces) else -1
 
     def checkPattern4(self):
         "Pattern con forma di tetramino a S o Z"
-        
-        for i in range(self.n):
-            for j in range(self.n):
-                if j<self.n-2 and i<self.n-1:
-                    if (self.pieces[i+1][j] == 1 and self.pieces[i][j+1] == 1 and
-                        self.pieces[i+1][j+1] == 1 and self.pieces[i][j+2] == 1) or (
-                        self.pieces[i][j] == 1 and self.pieces[i][j+1] == 1 and
-                        self.pieces[i+1][j+1] == 1 and self.pieces[i+1][j+2] == 1):
-                            return 1
-                elif j<self.n-1 and i<self.n-2:
-                    if (self.pieces[i+1][j] == 1 and self.pieces[i+2][j] == 1 and
-                        self.pieces[i][j+1] == 1 and self.pieces[i+1][j+1] == 1) or (
-                        self.pieces[i][j] == 1 and self.pieces[i+1][j] == 1 and
-                        self.pieces[i+1][j+1] == 1 and self.pieces[i+2][j+1] == 1):
-                            return 1       
-        return -1
+
+        return 1 if SZ_TETROMINO.exists(self.pieces) else -1
 
     def countDiff(self, player):
         """Conta il numero di celle nere che il player vede
@@ -124,55 +825,75 @@ class Board():
                 np.argwhere(self.mask2 == 1).tolist())) + ["guess_pattern",
                 "guess_nonpattern"]
 
-    def execute_move(self, move, player):
+    def execute_move(self, move, player, corretta=None):
         """Esegue le due mosse sulla "board"; in realtà modifica le maschere e
-        le informazioni, a seconda del player. (1 per player1, -1 per player2)"""
+        le informazioni, a seconda del player. (1 per player1, -1 per player2).
+        Gli hash sono aggiornati con un paio di XOR per ogni campo cambiato.
+        corretta dice se la risposta all'interrogazione è corretta; se è None
+        viene estratta a caso (vedi PROB_RISPOSTA_CORRETTA)."""
 
+        nn = self.n*self.n
         if player == 1:
 
             # move può contenere il guess oppure nell'ordine: gli indici
             # della cella da scoprire e poi quelli della cella da interrogare
 
             if move == "guess_pattern":
+                self.updateHash(7*nn, self.guess1, 1)
                 self.guess1 = 1
             elif move == "guess_nonpattern":
+                self.updateHash(7*nn, self.guess1, -1)
                 self.guess1 = -1
             else:
                 # aggiornamento della maschera dell'avversario
                 i,j = move[0]
+                self.updateHash(2*nn + i*self.n + j, self.mask2[i][j], 0)
                 self.mask2[i][j] = 0
                 
                 # interrogazione con risposta random
                 # 70% corretta, 30% altrimenti
                 h,k = move[1]
                 col = self.pieces[h][k]
-                if np.random.uniform(0,1) <= 0.7 :
-                    self.info1[h][k][col] += 1
+                if corretta is None:
+                    corretta = np.random.uniform(0,1) <= PROB_RISPOSTA_CORRETTA
+                if corretta:
+                    risposta = col
                 else:
                     if col == 1:
-                        self.info1[h][k][0] += 1
+                        risposta = 0
                     else:
-                        self.info1[h][k][1] += 1
+                        risposta = 1
+                self.updateHash(3*nn + 2*(h*self.n + k) + risposta,
+                                self.info1[h][k][risposta], self.info1[h][k][risposta] + 1)
+                self.info1[h][k][risposta] += 1
 
         else:
 
             if move == "guess_pattern":
+                self.updateHash(7*nn + 1, self.guess2, 1)
                 self.guess2 = 1
             elif move == "guess_nonpattern":
+                self.updateHash(7*nn + 1, self.guess2, -1)
                 self.guess2 = -1
             else:
                 # aggiornamento della maschera dell'avversario
                 i,j = move[0]
+                self.updateHash(nn + i*self.n + j, self.mask1[i][j], 0)
                 self.mask1[i][j] = 0
 
                 # interrogazione con risposta random
                 # 70% corretta, 30% altrimenti
                 h,k = move[1]
                 col = self.pieces[h][k]
-                if np.random.uniform(0,1) <= 0.7 :
-                    self.info2[h][k][col] += 1
+                if corretta is None:
+                    corretta = np.random.uniform(0,1) <= PROB_RISPOSTA_CORRETTA
+                if corretta:
+                    risposta = col
                 else:
                     if col == 1:
-                        self.info2[h][k][0] += 1
+                        risposta = 0
                     else:
-                        self.info2[h][k][1] += 1
+                        risposta = 1
+                self.updateHash(5*nn + 2*(h*self.n + k) + risposta,
+                                self.info2[h][k][risposta], self.info2[h][k][risposta] + 1)
+                self.info2[h][k][risposta] += 1
@@ -6,6 +6,7 @@ from tqdm import tqdm
 #sys.path.append('../../')
 from utils import *
 from NeuralNet import NeuralNet
+from ReplayBuffer import ReplayBuffer
 
 import tensorflow.compat.v1 as tf
 from MyGameNN import OthelloNNet as onnet
@@ -54,9 +55,13 @@ class NNetWrapper(NeuralNet):
         x = Flatten()(input_boards)
         x = Dense(64, activation='relu')(x)
         x = Dense(32, activation='relu')(x)
-        x = Dense(self.action_size, activation='softmax')(x)
+        pi = Dense(self.action_size, activation='softmax')(x)
+        v = Dense(1, activation='tanh')(x)
 
-        model = Model(inputs=input_boards, outputs=x)
+        model = Model(inputs=input_boards, outputs=[pi, v])
+        # compiled here so that train can step on the batches with train_on_batch
+        model.compile(optimizer=tf.keras.optimizers.Adam(args.lr),
+                      loss=['categorical_crossentropy', 'mean_squared_error'])
         return model
 
 
@@ -64,8 +69,10 @@ class NNetWrapper(NeuralNet):
 
     def train(self, examples):
         """
-        examples: list of examples, each example is of form (board, pi, v)
+        examples: ReplayBuffer, or list of examples, each example is of form (board, pi, v)
         """
+        if not isinstance(examples, ReplayBuffer):
+            examples = ReplayBuffer.fromExamples(examples)
 
         for epoch in range(args.epochs):
             print('EPOCH ::: ' + str(epoch + 1))
@@ -74,40 +81,40 @@ class NNetWrapper(NeuralNet):
             batch_count = int(len(examples) / args.batch_size)
 
             # self.sess.run(tf.local_variables_initializer())
-            t = tqdm(range(batch_count), desc='Training Net')
-            for _ in t:
-                sample_ids = np.random.randint(len(examples), size=args.batch_size)
-                boards, pis, vs = list(zip(*[examples[i] for i in sample_ids]))
-
-                # predict and compute gradient and do SGD step
-                input_dict = {self.nnet.input_boards: boards, self.nnet.target_pis: pis, self.nnet.target_vs: vs,
-                              self.nnet.dropout: args.dropout, self.nnet.isTraining: True}
-
-                # record loss
-                self.sess.run(self.nnet.train_step, feed_dict=input_dict)
-                pi_loss, v_loss = self.sess.run([self.nnet.loss_pi, self.nnet.loss_v], feed_dict=input_dict)
+            # the batches are assembled in a background thread while the
+            # previous step runs
+            t = tqdm(examples.prefetch(args.batch_size, batch_count), total=batch_count, desc='Training Net')
+            start = time.time()
+            for boards, pis, vs in t:
+                # predict and compute gradient and do SGD step, the losses
+                # come back from the same step
+                _, pi_loss, v_loss = self.nnet.train_on_batch(boards, [pis, vs])
                 pi_losses.update(pi_loss, len(boards))
                 v_losses.update(v_loss, len(boards))
-                t.set_postfix(Loss_pi=pi_losses, Loss_v=v_losses)
+                t.set_postfix(Loss_pi=pi_losses, Loss_v=v_losses,
+                              samples_s=int(pi_losses.count / max(time.time() - start, 1e-9)))
+            print('SAMPLES/SEC ::: {0:.0f}'.format(pi_losses.count / max(time.time() - start, 1e-9)))
 
     def predict(self, board):
         """
         board: np array with board
         """
-        # timing
-        start = time.time()
-
         # preparing input
         board = board[np.newaxis, :, :]
 
-        output = self.nnet.predict(board)
+        pis, vs = self.predict_batch(board)
+        return pis[0], vs[0]
 
-        # Extracting prob and v from output
-        prob = output[0]
-        v = output[0]
+    def predict_batch(self, boards):
+        """
+        boards: np array with boards stacked along the first axis
+        """
+        # a single forward pass for the whole batch: predict_on_batch skips the
+        # per-call input pipeline that model.predict builds
+        pis, vs = self.nnet.predict_on_batch(np.asarray(boards, dtype=np.float32))
 
         # print('PREDICTION TIME TAKEN : {0:03f}'.format(time.time()-start))
-        return prob, v
+        return np.asarray(pis), np.asarray(vs)[:, 0]
         # run
         #prob, v = self.sess.run([self.nnet.prob, self.nnet.v],
         #                        feed_dict={self.nnet.input_boards: board, self.nnet.dropout: 0,
@@ -0,0 +1,74 @@
+import numpy as np
+
+
+def guessAction(game, canonicalBoard, soglia):
+    """Ritorna l'azione di guess del pattern, o della sua assenza, se la sua
+    probabilità a posteriori è almeno soglia, altrimenti None (vedi
+    MyGame.getDecidedAction)"""
+
+    return game.getDecidedAction(canonicalBoard, soglia)
+
+
+class PosteriorPlayer():
+    """Giocatore euristico che non usa né la rete né MCTS, da usare
+    nell'Arena come avversario di riferimento.
+
+    Dichiara il guess appena la probabilità a posteriori del pattern (vedi
+    MyGame.getPatternProbability) è oltre la soglia in un senso o nell'altro,
+    o quando non restano interrogazioni; altrimenti interroga la cella
+    nascosta più incerta e scopre all'avversario una cella bianca, se ne ha,
+    perché le bianche sono le più comuni e gli dicono meno delle nere."""
+
+    def __init__(self, game, soglia=0.9):
+        """
+        Input: il MyGame e la soglia oltre cui la probabilità del pattern (o
+        della sua assenza) basta per dichiarare il guess
+        """
+        self.game = game
+        self.soglia = soglia
+
+    def __call__(self, canonicalBoard):
+        g = self.game
+        nn = g.n*g.n
+        guess = guessAction(g, canonicalBoard, self.soglia)
+        if guess is not None:
+            return guess
+        scoperte = np.flatnonzero(canonicalBoard[g.mask2Idx] == 1)
+        interrogate = np.flatnonzero(canonicalBoard[g.mask1Idx] == 1)
+        if len(scoperte) == 0 or len(interrogate) == 0:
+            # non restano interrogazioni: il guess più probabile
+            return guessAction(g, canonicalBoard, 0.5)
+
+        # la cella nascosta con la probabilità di essere nera più vicina a 0.5
+        nere = g.belief.marginals(canonicalBoard[np.newaxis])[0]
+        interrogata = interrogate[np.argmin(np.abs(nere[interrogate] - 0.5))]
+        bianche = scoperte[canonicalBoard[g.piecesIdx][scoperte] == 0]
+        scoperta = bianche[0] if len(bianche) else scoperte[0]
+        return scoperta*nn + interrogata
+
+
+class GuessPlayer():
+    """Avvolge un altro giocatore, ad esempio un PosteriorPlayer: quando la
+    probabilità a posteriori del pattern, o della sua assenza, è oltre la
+    soglia dichiara subito il guess, senza cercare; altrimenti lascia la
+    mossa al giocatore avvolto. MCTS fa lo stesso da sé con
+    args.guessThreshold, vedi main.py."""
+
+    def __init__(self, game, player, soglia=0.95):
+        """
+        Input: il MyGame, il giocatore avvolto e la soglia oltre cui si
+        dichiara il guess
+        """
+        self.game = game
+        self.player = player
+        self.soglia = soglia
+
+    def __call__(self, canonicalBoard):
+        guess = guessAction(self.game, canonicalBoard, self.soglia)
+        if guess is not None:
+            return guess
+        return self.player(canonicalBoard)
+
+    def reset(self):
+        if hasattr(self.player, 'reset'):
+            self.player.reset()
@@ -21,6 +21,8 @@ class NeuralNet():
                       (board, pi, v). pi is the MCTS informed policy vector for
                       the given board, and v is its value. The examples has
                       board in its canonical form.
+                      Coach passes a ReplayBuffer holding the same
+                      examples as arrays.
         """
         pass
 
@@ -36,6 +38,18 @@ class NeuralNet():
         """
         pass
 
+    def predict_batch(self, boards):
+        """
+        Input:
+            boards: a numpy array of boards in their canonical form, stacked
+                    along the first axis.
+
+        Returns:
+            pis: the policy vectors of the boards, one row per board
+            vs: the values of the boards, one per board
+        """
+        pass
+
     def save_checkpoint(self, folder, filename):
         """
         Saves the current neural network (with its parameters) in
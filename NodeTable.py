@@ -0,0 +1,231 @@
+import numpy as np
+
+
+class NodeTable():
+    """
+    Array-backed storage of the MCTS statistics.
+
+    Every state added to the table gets an integer id. The edges of a node,
+    one for each of its valid actions, occupy the contiguous slice
+    edgeStart[id]:edgeStart[id] + edgeCount[id] of the flat edge arrays, so the
+    statistics of a node are NumPy slices instead of dict entries keyed by
+    (s, a). The arrays are preallocated and grow geometrically when full.
+
+    Every edge also links up to two child nodes (an action followed by a
+    chance event, such as a noisy answer, can lead to different states).
+    The links let reroot drop the nodes that the game can no longer reach.
+
+    With chance=True every edge also keeps separate statistics for the (at
+    most two) chance outcomes of its action, see MCTS with args.mctsChance.
+
+    With maxNodes the node arrays never grow past maxNodes entries, and the
+    edge arrays past maxNodes times the average number of edges per node
+    seen so far, unless more are actually needed: the caller keeps the
+    table within the limit with reroot.
+    """
+
+    def __init__(self, nodeCapacity=1024, edgeCapacity=16384, chance=False, maxNodes=None):
+        self.maxNodes = maxNodes
+        if maxNodes is not None:
+            nodeCapacity = min(nodeCapacity, maxNodes)
+        self.ids = {}  # state key -> node id
+        self.keys = []  # node id -> state key
+        self.numNodes = 0
+        self.numEdges = 0
+
+        # per node
+        self.Ns = np.zeros(nodeCapacity, dtype=np.int32)  # #times the node was visited
+        self.VLs = np.zeros(nodeCapacity, dtype=np.int32)  # pending (virtual loss) visits of the node
+        self.Es = np.zeros(nodeCapacity, dtype=np.float64)  # game.getGameEnded for the node
+        self.edgeStart = np.zeros(nodeCapacity, dtype=np.int64)  # first edge of the node
+        self.edgeCount = np.zeros(nodeCapacity, dtype=np.int32)  # #valid actions of the node
+
+        # per edge
+        self.actions = np.zeros(edgeCapacity, dtype=np.int32)  # action of the edge
+        self.P = np.zeros(edgeCapacity, dtype=np.float64)  # initial policy (returned by neural net)
+        self.N = np.zeros(edgeCapacity, dtype=np.int32)  # #times the edge was visited
+        self.W = np.zeros(edgeCapacity, dtype=np.float64)  # sum of the values backed up on the edge
+        self.VL = np.zeros(edgeCapacity, dtype=np.int32)  # pending (virtual loss) visits of the edge
+        self.child0 = np.zeros(edgeCapacity, dtype=np.int32)  # first child node reached by the edge, -1 if none
+        self.child1 = np.zeros(edgeCapacity, dtype=np.int32)  # second child node reached by the edge, -1 if none
+
+        self.chance = chance
+        if chance:
+            self.EDGE_ARRAYS = NodeTable.EDGE_ARRAYS + NodeTable.CHANCE_ARRAYS
+            self.chanceP = np.zeros(edgeCapacity, dtype=np.float64)  # probability of the first outcome of the edge
+            self.N0 = np.zeros(edgeCapacity, dtype=np.int32)  # #times the first outcome was visited
+            self.N1 = np.zeros(edgeCapacity, dtype=np.int32)  # #times the second outcome was visited
+            self.W0 = np.zeros(edgeCapacity, dtype=np.float64)  # sum of the values backed up through the first outcome
+            self.W1 = np.zeros(edgeCapacity, dtype=np.float64)  # sum of the values backed up through the second outcome
+
+    NODE_ARRAYS = ('Ns', 'VLs', 'Es', 'edgeStart', 'edgeCount')
+    EDGE_ARRAYS = ('actions', 'P', 'N', 'W', 'VL', 'child0', 'child1')
+    CHANCE_ARRAYS = ('chanceP', 'N0', 'N1', 'W0', 'W1')
+
+    def __len__(self):
+        return self.numNodes
+
+    def find(self, s):
+        """
+        Returns:
+            node: the id of the state s, or -1 if s is not in the table
+        """
+        return self.ids.get(s, -1)
+
+    def add(self, s, ended, actions=(), P=()):
+        """
+        Adds the state s with game.getGameEnded value ended and one edge for
+        each of the given actions, with initial policy P.
+
+        Returns:
+            node: the id of s
+        """
+        k = len(actions)
+        if self.numNodes == len(self.Ns):
+            self._grow(self.NODE_ARRAYS, self.numNodes + 1, self.maxNodes)
+        if self.numEdges + k > len(self.N):
+            limit = None
+            if self.maxNodes is not None:
+                limit = (self.numEdges + k) * self.maxNodes // (self.numNodes + 1)
+            self._grow(self.EDGE_ARRAYS, self.numEdges + k, limit)
+
+        node = self.numNodes
+        start = self.numEdges
+        self.ids[s] = node
+        self.keys.append(s)
+        self.numNodes += 1
+        self.numEdges += k
+
+        self.Ns[node] = 0
+        self.VLs[node] = 0
+        self.Es[node] = ended
+        self.edgeStart[node] = start
+        self.edgeCount[node] = k
+
+        self.actions[start:start + k] = actions
+        self.P[start:start + k] = P
+        self.N[start:start + k] = 0
+        self.W[start:start + k] = 0
+        self.VL[start:start + k] = 0
+        self.child0[start:start + k] = -1
+        self.child1[start:start + k] = -1
+        if self.chance:
+            self.chanceP[start:start + k] = 1
+            self.N0[start:start + k] = 0
+            self.N1[start:start + k] = 0
+            self.W0[start:start + k] = 0
+            self.W1[start:start + k] = 0
+        return node
+
+    def edges(self, node):
+        """
+        Returns:
+            (start, end): the range of the edges of node in the edge arrays
+        """
+        start = self.edgeStart[node]
+        return start, start + self.edgeCount[node]
+
+    def link(self, e, child):
+        """
+        Records that edge e led to node child. Only the first two distinct
+        children of an edge are recorded.
+        """
+        if self.child0[e] == child or self.child1[e] == child:
+            return
+        if self.child0[e] < 0:
+            self.child0[e] = child
+        elif self.child1[e] < 0:
+            self.child1[e] = child
+
+    def clear(self):
+        """
+        Removes all the nodes, keeping the allocated arrays.
+        """
+        self.ids = {}
+        self.keys = []
+        self.numNodes = 0
+        self.numEdges = 0
+
+    def reroot(self, root, maxNodes=None):
+        """
+        Keeps only root and the nodes reachable from it through the child
+        links, at most maxNodes of them, the closest to root first, and
+        compacts them to the front of the arrays. Links to the dropped nodes
+        are cut, so a search reaching them adds them again. If root is -1 the
+        table is cleared.
+
+        Returns:
+            root: the new id of root (always 0), or -1 if the table is empty
+        """
+        if root < 0:
+            self.clear()
+            return -1
+        limit = self.numNodes if maxNodes is None else max(int(maxNodes), 1)
+
+        # breadth-first visit, one level at a time
+        newIds = np.full(self.numNodes, -1, dtype=np.int64)
+        newIds[root] = 0
+        levels = [np.array([root])]
+        count = 1
+        frontier = levels[0]
+        while len(frontier) and count < limit:
+            edges = self._edgeIndices(frontier)
+            children = np.concatenate((self.child0[edges], self.child1[edges]))
+            children = children[children >= 0]
+            children = children[newIds[children] < 0]
+            _, first = np.unique(children, return_index=True)
+            children = children[np.sort(first)][:limit - count]
+            newIds[children] = np.arange(count, count + len(children))
+            count += len(children)
+            levels.append(children)
+            frontier = children
+        order = np.concatenate(levels)
+
+        edges = self._edgeIndices(order)
+        for name in self.NODE_ARRAYS:
+            array = getattr(self, name)
+            array[:count] = array[order]
+        for name in self.EDGE_ARRAYS:
+            array = getattr(self, name)
+            array[:len(edges)] = array[edges]
+        self.edgeStart[:count] = np.cumsum(self.edgeCount[:count]) - self.edgeCount[:count]
+        for child in (self.child0, self.child1):
+            links = child[:len(edges)]
+            links[links >= 0] = newIds[links[links >= 0]]
+
+        self.keys = [self.keys[i] for i in order]
+        self.ids = {s: i for i, s in enumerate(self.keys)}
+        self.numNodes = count
+        self.numEdges = len(edges)
+        return 0
+
+    def _edgeIndices(self, nodes):
+        """
+        Returns:
+            edges: the indices of all the edges of nodes, node after node
+        """
+        counts = self.edgeCount[nodes].astype(np.int64)
+        offsets = np.cumsum(counts) - counts
+        return np.repeat(self.edgeStart[nodes] - offsets, counts) + np.arange(counts.sum())
+
+    def nbytes(self):
+        """
+        Returns:
+            bytes: memory used by the preallocated arrays
+        """
+        return sum(getattr(self, name).nbytes for name in self.NODE_ARRAYS + self.EDGE_ARRAYS)
+
+    def _grow(self, names, size, limit=None):
+        """
+        Grows the arrays names to hold at least size entries, doubling their
+        capacity but not past limit (if given) unless size needs it.
+        """
+        capacity = 2 * len(getattr(self, names[0]))
+        if limit is not None:
+            capacity = min(capacity, limit)
+        capacity = max(size, capacity)
+        for name in names:
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
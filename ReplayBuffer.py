@@ -0,0 +1,253 @@
+import json
+import logging
+import os
+import queue
+import threading
+from collections import deque
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+class ReplayBuffer():
+    """
+    Training examples (board, pi, v) of the latest self-play iterations,
+    stored in preallocated ring arrays instead of lists of tuples.
+
+    The examples of an iteration are added together and form a segment of the
+    ring; the live examples are the contiguous (modulo capacity) range that
+    starts at the oldest segment. When the buffer is full, or holds
+    maxIterations segments, whole iterations are dropped from the oldest one.
+    Batches are gathered with fancy indexing, so sampling never touches
+    Python objects.
+
+    On disk (see save and load) every iteration is a shard of three .npy
+    files, written once, plus a small JSON manifest listing the live shards.
+    """
+
+    MANIFEST = 'manifest.json'
+    COLUMNS = ('boards', 'pis', 'vs')
+
+    def __init__(self, boardShape, actionSize, capacity, maxIterations=None):
+        """
+        Input:
+            boardShape: shape of a board as given to the network, e.g. (n, n)
+            actionSize: length of the policy vectors
+            capacity: maximum number of examples kept
+            maxIterations: maximum number of iterations kept, None for no
+                           limit other than capacity
+        """
+        self.capacity = capacity
+        self.maxIterations = maxIterations
+        self.boards = np.zeros((capacity,) + tuple(boardShape), dtype=np.float32)
+        self.pis = np.zeros((capacity, actionSize), dtype=np.float32)
+        self.vs = np.zeros(capacity, dtype=np.float32)
+        self.segments = deque()  # (id, start, length) of every iteration, oldest first
+        self.nextId = 0  # id of the next iteration added
+        self.start = 0  # first live example
+        self.size = 0  # number of live examples
+        self.savedFolder = None  # folder the buffer saves to, see save
+        self.saved = set()  # ids of the iterations whose shards are in savedFolder
+
+    @classmethod
+    def fromExamples(cls, examples):
+        """
+        Builds a buffer holding the single iteration of a list of (board, pi,
+        v) examples.
+        """
+        boards, pis, vs = cls.stack(examples)
+        buffer = cls(boards.shape[1:], pis.shape[1], max(len(vs), 1))
+        buffer.addIteration(boards, pis, vs)
+        return buffer
+
+    @staticmethod
+    def stack(examples):
+        """
+        Returns:
+            boards, pis, vs: the arrays of a list of (board, pi, v) examples
+        """
+        boards, pis, vs = zip(*examples)
+        return (np.asarray(boards, dtype=np.float32), np.asarray(pis, dtype=np.float32),
+                np.asarray(vs, dtype=np.float32))
+
+    def __len__(self):
+        return self.size
+
+    def numIterations(self):
+        return len(self.segments)
+
+    def addIteration(self, boards, pis, vs, segmentId=None):
+        """
+        Adds the examples of a new iteration, dropping the oldest iterations
+        as needed. If the iteration alone exceeds capacity only its latest
+        examples are kept. segmentId is only given by load, to keep the ids
+        of the shards.
+        """
+        if segmentId is None:
+            segmentId = self.nextId
+        self.nextId = max(self.nextId, segmentId + 1)
+        k = len(vs)
+        if k > self.capacity:
+            boards, pis, vs = boards[-self.capacity:], pis[-self.capacity:], vs[-self.capacity:]
+            k = self.capacity
+        while self.segments and (self.size + k > self.capacity or
+                                 (self.maxIterations is not None and len(self.segments) >= self.maxIterations)):
+            self.dropOldest()
+
+        position = (self.start + self.size) % self.capacity
+        idx = (position + np.arange(k)) % self.capacity
+        self.boards[idx] = boards
+        self.pis[idx] = pis
+        self.vs[idx] = vs
+        self.segments.append((segmentId, position, k))
+        if not self.size:
+            self.start = position
+        self.size += k
+
+    def dropOldest(self):
+        """
+        Drops the examples of the oldest iteration.
+        """
+        log.warning(f"Removing the oldest entry in trainExamples. numIterations = {len(self.segments)}")
+        _, _, k = self.segments.popleft()
+        self.start = (self.start + k) % self.capacity
+        self.size -= k
+
+    def indices(self):
+        """
+        Returns:
+            idx: the positions of the live examples in the ring arrays, oldest
+                 first
+        """
+        return (self.start + np.arange(self.size)) % self.capacity
+
+    def iterations(self):
+        """
+        Yields the (boards, pis, vs) arrays of every iteration, oldest first.
+        """
+        for _, position, k in self.segments:
+            idx = (position + np.arange(k)) % self.capacity
+            yield self.boards[idx], self.pis[idx], self.vs[idx]
+
+    def sample(self, batchSize, rng=np.random):
+        """
+        Returns:
+            boards, pis, vs: a batch of batchSize examples drawn uniformly with
+                             replacement
+        """
+        idx = (self.start + rng.randint(self.size, size=batchSize)) % self.capacity
+        return self.boards[idx], self.pis[idx], self.vs[idx]
+
+    def prefetch(self, batchSize, numBatches, depth=2):
+        """
+        Yields numBatches batches drawn as by sample. The batches are gathered
+        by a background thread that stays up to depth batches ahead of the
+        consumer, so the next batch is ready when the training step ends.
+        """
+        batches = queue.Queue(depth)
+        stop = threading.Event()
+
+        def put(item):
+            # gives up when the consumer stops early and the queue stays full
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def produce():
+            try:
+                for _ in range(numBatches):
+                    if not put(self.sample(batchSize)):
+                        return
+            except Exception as e:
+                put(e)
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+        try:
+            for _ in range(numBatches):
+                batch = batches.get()
+                if isinstance(batch, Exception):
+                    raise batch
+                yield batch
+        finally:
+            stop.set()
+            producer.join()
+
+    def shardFile(self, folder, segmentId, column):
+        return os.path.join(folder, f'iter_{segmentId:06d}_{column}.npy')
+
+    def save(self, folder):
+        """
+        Saves the buffer to folder incrementally: only the iterations this
+        buffer has not written there yet are written, the manifest is replaced
+        atomically, and the shards of the iterations dropped from the buffer
+        are deleted. The first time a buffer saves to a folder (other than the
+        one it was loaded from) the shards already there, e.g. those of an
+        earlier run, are deleted: their ids may clash with the new ones.
+        """
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        if self.savedFolder != os.path.abspath(folder):
+            for name in os.listdir(folder):
+                if name.startswith('iter_') and (name.endswith('.npy') or name.endswith('.npy.tmp')):
+                    os.remove(os.path.join(folder, name))
+            self.savedFolder = os.path.abspath(folder)
+            self.saved = set()
+
+        for segmentId, position, k in self.segments:
+            if segmentId in self.saved:
+                continue
+            idx = (position + np.arange(k)) % self.capacity
+            for column in self.COLUMNS:
+                filename = self.shardFile(folder, segmentId, column)
+                # write under a temporary name, so a crash never leaves a
+                # truncated shard behind a valid name
+                with open(filename + '.tmp', 'wb') as f:
+                    np.save(f, getattr(self, column)[idx])
+                os.replace(filename + '.tmp', filename)
+            self.saved.add(segmentId)
+
+        manifest = {'boardShape': list(self.boards.shape[1:]), 'actionSize': self.pis.shape[1],
+                    'nextId': self.nextId,
+                    'iterations': [{'id': segmentId, 'size': k} for segmentId, _, k in self.segments]}
+        filename = os.path.join(folder, self.MANIFEST)
+        with open(filename + '.tmp', 'w') as f:
+            json.dump(manifest, f)
+        os.replace(filename + '.tmp', filename)
+
+        self.saved &= {segmentId for segmentId, _, _ in self.segments}
+        live = {os.path.basename(self.shardFile(folder, segmentId, column))
+                for segmentId, _, _ in self.segments for column in self.COLUMNS}
+        for name in os.listdir(folder):
+            if name.startswith('iter_') and name.endswith('.npy') and name not in live:
+                os.remove(os.path.join(folder, name))
+
+    @staticmethod
+    def exists(folder):
+        return os.path.isfile(os.path.join(folder, ReplayBuffer.MANIFEST))
+
+    @classmethod
+    def load(cls, folder, capacity, maxIterations=None):
+        """
+        Loads a buffer saved by save. The shards are memory-mapped and copied
+        straight into the ring arrays.
+        """
+        with open(os.path.join(folder, cls.MANIFEST)) as f:
+            manifest = json.load(f)
+        buffer = cls(manifest['boardShape'], manifest['actionSize'], capacity, maxIterations)
+        for iteration in manifest['iterations']:
+            arrays = [np.load(buffer.shardFile(folder, iteration['id'], column), mmap_mode='r')
+                      for column in cls.COLUMNS]
+            buffer.addIteration(*arrays, segmentId=iteration['id'])
+        buffer.nextId = max(buffer.nextId, manifest['nextId'])
+        # the shards of the live iterations are already in folder, unless
+        # an iteration was cut to fit capacity
+        sizes = {iteration['id']: iteration['size'] for iteration in manifest['iterations']}
+        buffer.savedFolder = os.path.abspath(folder)
+        buffer.saved = {segmentId for segmentId, _, k in buffer.segments if sizes[segmentId] == k}
+        return buffer
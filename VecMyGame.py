@@ -0,0 +1,138 @@
+from MyGame import MyGame
+from MyLogic import Board, PROB_RISPOSTA_CORRETTA
+
+import numpy as np
+
+class VecMyGame():
+    """ Versione vettoriale di MyGame: tiene B partite come stati compatti
+    impilati (vedi Board.toState) e ne fa avanzare tutte insieme, così che
+    una sola chiamata alla rete possa servire le B partite (self-play e
+    arena in lockstep).
+
+    Ogni partita ha il proprio player corrente in self.players; i metodi
+    lavorano sempre dal punto di vista del player che deve muovere in
+    ciascuna partita."""
+
+    def __init__(self, n, B, rng=None, autoReset=True):
+        """
+        Input: dimensione n della board, numero B di partite, il
+        np.random.Generator da cui viene tutta la casualità (board iniziali
+        e risposte alle interrogazioni) e se ricominciare automaticamente le
+        partite finite
+        """
+        self.game = MyGame(n)
+        self.n = n
+        self.B = B
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.autoReset = autoReset
+
+        self.boards = Board.batch(n, B, self.rng)
+        self.players = np.ones(B, dtype=int)
+
+    def reset(self, games=None):
+        """Ricomincia le partite indicate da games (indici o maschera
+        booleana, tutte se None) con board nuove e il player1 che muove"""
+
+        games = np.arange(self.B) if games is None else np.asarray(games)
+        if games.dtype == bool:
+            games = np.flatnonzero(games)
+        self.boards[games] = Board.batch(self.n, len(games), self.rng)
+        self.players[games] = 1
+
+    def getCanonicalForm(self):
+        """Ritorna le canonicalBoard (B, stateSize) di tutte le partite, come
+        MyGame.getCanonicalForm con il player corrente di ognuna"""
+
+        return np.where(self.players[:, np.newaxis] == 1, self.boards,
+                        self.boards[:, self.game.swap])
+
+    def getObservation(self, canonicalBoards=None):
+        """Ritorna gli input della rete (B, n, n) per le canonicalBoard date,
+        di default quelle correnti; come MyGame.getObservation"""
+
+        if canonicalBoards is None:
+            canonicalBoards = self.getCanonicalForm()
+        return self.game.getObservationBatch(canonicalBoards)
+
+    def getValidMoves(self, canonicalBoards=None):
+        """Ritorna le mosse valide (B, actionSize) del player corrente di ogni
+        partita, come MyGame.getValidMoves"""
+
+        if canonicalBoards is None:
+            canonicalBoards = self.getCanonicalForm()
+        g = self.game
+        # per il player che muove la cella da scoprire è nella mask2 e
+        # quella da interrogare nella mask1 (vedi MyGame.getValidActions)
+        scoperte = canonicalBoards[:, g.mask2Idx] == 1
+        interrogate = canonicalBoards[:, g.mask1Idx] == 1
+        valids = np.ones((len(canonicalBoards), g.getActionSize()), dtype=np.int8)
+        valids[:, :self.n**4] = (scoperte[:, :, np.newaxis] &
+                                 interrogate[:, np.newaxis, :]).reshape((-1, self.n**4))
+        return valids
+
+    def getGameEnded(self):
+        """Ritorna r (B,): come MyGame.getGameEnded per il player corrente di
+        ogni partita, 0 se la partita non è finita"""
+
+        return self.gameEndedPlayer1(self.boards) * self.players
+
+    def gameEndedPlayer1(self, boards):
+        "Risultato delle partite boards dal punto di vista del player1"
+
+        g = self.game
+        guess1 = boards[:, g.guess1Idx]
+        guess2 = boards[:, g.guess2Idx]
+        case = boards[:, g.caseIdx]
+        return np.select([guess1 == case, guess1 == -case, guess2 == case, guess2 == -case],
+                         [1, -1, -1, 1], 0)
+
+    def getNextState(self, actions):
+        """
+        Input: l'azione (B,) compiuta dal player corrente di ogni partita
+
+        Esegue le B mosse, con una sola estrazione dal rng per le risposte
+        alle interrogazioni (70% corrette, 30% altrimenti), e passa il turno.
+
+        Ritorna ended (B,): il risultato dal punto di vista del player1 delle
+        partite finite con questa mossa, 0 per le altre. Con autoReset le
+        partite finite sono già state ricominciate.
+        """
+        g = self.game
+        n2, n4 = self.n**2, self.n**4
+        actions = np.asarray(actions)
+        rows = np.arange(self.B)
+
+        # la mossa è eseguita dal player1 sulla canonicalBoard, poi lo
+        # scambio dei ruoli (che è un'involuzione) riporta la board com'era
+        c = self.getCanonicalForm()
+
+        # ogni campo cambiato aggiorna anche gli hash (vedi Zobrist)
+        z = Board.zobrist(self.n)
+
+        inter = actions < n4
+        r, a = rows[inter], actions[inter]
+        scoperta, interrogata = a // n2, a % n2
+        # aggiornamento della maschera dell'avversario
+        pos = g.mask2Idx.start + scoperta
+        z.update(c, r, pos, c[r, pos], 0)
+        c[r, pos] = 0
+        # interrogazione con risposta random
+        col = c[r, interrogata]
+        corretta = self.rng.uniform(0, 1, size=len(r)) <= PROB_RISPOSTA_CORRETTA
+        risposta = np.where(corretta, col, 1 - col)
+        pos = g.info1Idx.start + 2*interrogata + risposta
+        z.update(c, r, pos, c[r, pos], c[r, pos] + 1)
+        c[r, pos] += 1
+
+        r = rows[~inter]
+        guess = np.where(actions[r] == n4, 1, -1)
+        z.update(c, r, g.guess1Idx, c[r, g.guess1Idx], guess)
+        c[r, g.guess1Idx] = guess
+
+        self.boards = np.where(self.players[:, np.newaxis] == 1, c, c[:, g.swap])
+        self.players = -self.players
+
+        ended = self.gameEndedPlayer1(self.boards)
+        if self.autoReset and ended.any():
+            self.reset(ended != 0)
+        return ended
@@ -0,0 +1,172 @@
+"""
+Microbenchmarks of the hot paths of self-play. Run with: python bench.py
+"""
+import math
+import time
+
+import numpy as np
+import numpy.ma as ma
+
+from MyGame import MyGame
+from MyLogic import Board, DOMINO, SZ_TETROMINO
+
+
+def timeit(f, number):
+    """Returns the average seconds per call of f over number calls."""
+    start = time.perf_counter()
+    for _ in range(number):
+        f()
+    return (time.perf_counter() - start) / number
+
+
+def randomStates(game, count, seed=0):
+    """Returns count canonical states reached by playing random interrogations."""
+    np.random.seed(seed)
+    states = []
+    for _ in range(count):
+        board = game.getInitBoard()
+        player = 1
+        for _ in range(np.random.randint(game.n * game.n // 2)):
+            actions = game.getValidActions(board, player)[:-2]
+            if len(actions) == 0:
+                break
+            board, player = game.getNextState(board, player, np.random.choice(actions))
+        states.append(game.getCanonicalForm(board, player))
+    return states
+
+
+def stimaValore(bianco, nero):
+    """MyGame.stimaValore, the per-cell estimate replaced by Belief.marginals."""
+    if nero == bianco:
+        return 0.5
+    elif nero > bianco:
+        return 0.5 + (1-math.exp(-((nero-bianco)/(1+(np.abs(nero-bianco))))))/2
+    else:
+        return 1 - (0.5 + (1-math.exp(-((bianco-nero)/(1+(np.abs(bianco-nero))))))/2)
+
+
+def legacyObservation(game, board):
+    """getCanonicalForm as it was before getObservation was vectorized."""
+    b = Board.fromState(game.n, board)
+    mx = ma.masked_array(b.pieces, mask=b.mask1, dtype=float)
+    for i in range(game.n):
+        for j in range(game.n):
+            if mx.mask[i][j] == True:
+                mx[i][j] = np.round(stimaValore(b.info1[i][j][0], b.info1[i][j][1]), 3)
+    return mx.data
+
+
+def tableObservation(stime, game, board):
+    """getObservation as it was between the vectorization and the exact
+    posterior: stimaValore read from a precomputed table."""
+    info1 = board[game.info1Idx].reshape((game.n * game.n, 2))
+    mx = np.where(board[game.mask1Idx] != 0, stime[info1[:, 0], info1[:, 1]], board[game.piecesIdx])
+    return mx.reshape((game.n, game.n))
+
+
+def stimaTable(n):
+    """The table of stimaValore used by tableObservation."""
+    m = (n * n) // 2
+    return np.array([[np.round(stimaValore(bianco, nero), 3) for nero in range(m + 1)] for bianco in range(m + 1)])
+
+
+def benchObservation(sizes=(3, 6, 9, 12), count=50):
+    print('getObservation (canonical board): per-cell estimate vs exact posterior')
+    print(f'{"n":>4} {"legacy [us]":>12} {"table [us]":>11} {"uncached [us]":>15} '
+          f'{"cached [us]":>12} {"batch [us]":>11}')
+    for n in sizes:
+        game = MyGame(n)
+        states = randomStates(game, count)
+        stime = stimaTable(n)
+        for s in states:
+            # the cells the player sees are unchanged
+            seen = s[game.mask1Idx] == 0
+            assert np.array_equal(legacyObservation(game, s), tableObservation(stime, game, s))
+            assert np.array_equal(legacyObservation(game, s).ravel()[seen], game.getObservation(s).ravel()[seen])
+        legacy = timeit(lambda: [legacyObservation(game, s) for s in states], 3) / count
+        table = timeit(lambda: [tableObservation(stime, game, s) for s in states], 10) / count
+        # without the cache, as on the first visit of an information state
+        single = timeit(lambda: [game.belief.classMarginals(s[np.newaxis]) for s in states], 10) / count
+        # getObservation of states already seen, as in a search
+        cached = timeit(lambda: [game.getObservation(s) for s in states], 10) / count
+        batch = timeit(lambda: game.belief.dynamicMarginals(np.array(states)), 10) / count
+        print(f'{n:>4} {1e6 * legacy:>12.1f} {1e6 * table:>11.1f} {1e6 * single:>15.1f} '
+              f'{1e6 * cached:>12.1f} {1e6 * batch:>11.1f}')
+
+
+def benchPatternProbability(sizes=(3, 4, 5, 6), count=20):
+    print('P(pattern) of an information state (first call, then cached)')
+    print(f'{"n":>4} {"first [ms]":>11} {"cached [us]":>12}')
+    for n in sizes:
+        game = MyGame(n)
+        states = randomStates(game, count)
+        first = timeit(lambda: [game.getPatternProbability(s) for s in states], 1) / count
+        cached = timeit(lambda: [game.getPatternProbability(s) for s in states], 10) / count
+        print(f'{n:>4} {1e3 * first:>11.2f} {1e6 * cached:>12.1f}')
+
+
+def legacyCheckPattern2(pieces):
+    """Board.checkPattern2 as it was before the PatternSet engine."""
+    n = len(pieces)
+    for i in range(n):
+        for j in range(n):
+            if j < n - 1 and pieces[i][j] == 1 and pieces[i][j+1] == 1:
+                return 1
+            if i < n - 1 and pieces[i][j] == 1 and pieces[i+1][j] == 1:
+                return 1
+    return -1
+
+
+def legacyCheckPattern4(pieces):
+    """Board.checkPattern4 as it was before the PatternSet engine, with the
+    vertical forms checked on every cell (the original elif skipped them
+    wherever a horizontal form fits)."""
+    n = len(pieces)
+    for i in range(n):
+        for j in range(n):
+            if j < n - 2 and i < n - 1:
+                if (pieces[i+1][j] == 1 and pieces[i][j+1] == 1 and
+                        pieces[i+1][j+1] == 1 and pieces[i][j+2] == 1) or (
+                        pieces[i][j] == 1 and pieces[i][j+1] == 1 and
+                        pieces[i+1][j+1] == 1 and pieces[i+1][j+2] == 1):
+                    return 1
+            if j < n - 1 and i < n - 2:
+                if (pieces[i+1][j] == 1 and pieces[i+2][j] == 1 and
+                        pieces[i][j+1] == 1 and pieces[i+1][j+1] == 1) or (
+                        pieces[i][j] == 1 and pieces[i+1][j] == 1 and
+                        pieces[i+1][j+1] == 1 and pieces[i+2][j+1] == 1):
+                    return 1
+    return -1
+
+
+def benchPatterns(sizes=(3, 6, 9, 12), count=10000):
+    rng = np.random.default_rng(0)
+    for name, patterns, legacyCheck, density in (('domino', DOMINO, legacyCheckPattern2, 0.22),
+                                                 ('S/Z tetromino', SZ_TETROMINO, legacyCheckPattern4, 0.4)):
+        print(f'{name} pattern detection on random initial boards')
+        print(f'{"n":>4} {"legacy loop [us]":>17} {"batch [us]":>11} {"speedup":>8}')
+        for n in sizes:
+            black = int(np.ceil(n * n * density))
+            boards = rng.permuted(np.tile(np.arange(n * n) < black, (count, 1)), axis=1).reshape(count, n, n).astype(int)
+            labels = patterns.exists(boards[:200])
+            assert (labels == (np.array([legacyCheck(b) for b in boards[:200]]) == 1)).all()
+            legacy = timeit(lambda: [legacyCheck(b) for b in boards[:1000]], 1) / 1000
+            fast = timeit(lambda: patterns.exists(boards), 3) / count
+            print(f'{n:>4} {1e6 * legacy:>17.2f} {1e6 * fast:>11.2f} {legacy / fast:>7.1f}x')
+
+
+def benchBoardBatch(sizes=(3, 6, 9, 12), count=10000):
+    print('initial boards')
+    print(f'{"n":>4} {"Board(n) [us]":>14} {"Board.batch [us]":>17} {"speedup":>8}')
+    rng = np.random.default_rng(0)
+    for n in sizes:
+        legacy = timeit(lambda: [Board(n).toState() for _ in range(1000)], 1) / 1000
+        fast = timeit(lambda: Board.batch(n, count, rng), 3) / count
+        print(f'{n:>4} {1e6 * legacy:>14.2f} {1e6 * fast:>17.2f} {legacy / fast:>7.1f}x')
+
+
+if __name__ == "__main__":
+    benchObservation()
+    benchPatternProbability()
+    benchPatterns()
+    benchBoardBatch()
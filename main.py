@@ -18,9 +18,27 @@ args = dotdict({
     'updateThreshold': 0.6,     # Durante i playoff dell'arena, la nuova rete neurale sarà accettata se vince più della soglia specificata di partite.
     'maxlenOfQueue': 2000,    # Numero massimo di esempi di gioco per addestrare le reti neurali.
     'numMCTSSims': 3,           # Numero di simulazioni di MCTS (Monte Carlo Tree Search) per mossa di gioco.
+    'numSelfPlayWorkers': 1,    # Numero di processi che giocano le partite di auto-gioco in parallelo (1 = nel processo principale).
+    'inferenceServer': False,   # Se True i processi di auto-gioco usano la rete del processo principale tramite un InferenceServer.
+    'inferenceBatchSize': 64,   # Numero massimo di board valutate dall'InferenceServer in un forward pass.
+    'inferenceMaxWait': 0.002,  # Secondi che l'InferenceServer attende per riempire un batch.
+    'seed': None,               # Seme da cui derivano i semi delle singole partite di auto-gioco e dell'arena; None per partite non ripetibili.
     'arenaCompare': 40,         # Numero di partite da giocare durante il confronto dell'arena per determinare se la nuova rete sarà accettata.
+    'numArenaWorkers': 1,       # Numero di processi che giocano le partite dell'arena in parallelo (1 = nel processo principale).
+    'arenaSPRT': False,         # Se True l'arena si ferma appena un test sequenziale (SPRT) decide se accettare la nuova rete.
+    'arenaSPRTDelta': 0.1,      # Il test confronta una percentuale di vittorie di updateThreshold - delta con una di updateThreshold + delta.
+    'arenaSPRTAlpha': 0.05,     # Probabilità di accettare per errore una rete che non raggiunge la soglia.
+    'arenaSPRTBeta': 0.05,      # Probabilità di rifiutare per errore una rete che supera la soglia.
     'cpuct': 1,                 #Parametro per il calcolo dell'upper confidence bound nell'algoritmo MCTS.
-
+    'mctsBatchSize': 1,         # Numero di foglie MCTS valutate insieme dalla rete in un unico forward pass (1 = ricerca sequenziale).
+    'symmetricMCTS': False,     # Se True MCTS riunisce in un solo nodo gli stati equivalenti per rotazione o riflessione della board.
+    'mctsReroot': False,        # Se True a ogni mossa MCTS tiene solo il sottoalbero della nuova radice e libera il resto.
+    'mctsMaxNodes': 0,          # Numero massimo di nodi dell'albero MCTS, superabile solo di mctsBatchSize durante una ricerca; oltre si tengono quelli più vicini alla radice (0 = nessun limite).
+    'mctsChance': False,        # Se True MCTS segue entrambi gli esiti delle risposte alle interrogazioni, pesandone i valori con le loro probabilità.
+    'mctsInformationSet': False,  # Se True MCTS non usa le celle nascoste: ogni simulazione parte da una board estratta tra quelle coerenti con ciò che il player vede.
+    'guessThreshold': 0,        # Se > 0, quando la probabilità del pattern (o della sua assenza) raggiunge questa soglia si dichiara il guess senza cercare, in auto-gioco e nell'arena (0 = sempre con MCTS).
+
+    'patternTables': './tables/',  # Cartella delle tabelle precalcolate della presenza del pattern (vedi tables.py); se mancano il pattern si cerca.
     'checkpoint': './temp/',
     'load_model': False,
     'load_folder_file': ('/dev/models/8x100x50','best.pth.tar'),
@@ -39,7 +57,7 @@ def main():
     # print("rinnovato")
 
     log.info('Loading %s...', Game.__name__)
-    g = Game(3)
+    g = Game(3, patternTables=args.patternTables)
 
     log.info('Loading %s...', nn.__name__)
     nnet = nn(g)
@@ -0,0 +1,20 @@
+"""
+Builds the PatternTable files of the small boards, read by MyGame through its
+patternTables folder. Run with: python tables.py [folder]
+"""
+import sys
+import time
+
+from MyLogic import PatternTable
+
+
+def main(folder='./tables/'):
+    for n in range(2, PatternTable.MAX_N + 1):
+        start = time.perf_counter()
+        table = PatternTable.build(n, folder)
+        print(f'n={n}: {2**(n*n)} boards in {table.bits.nbytes} bytes, '
+              f'{time.perf_counter() - start:.2f}s -> {PatternTable.filename(folder, n)}')
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
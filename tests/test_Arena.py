@@ -0,0 +1,45 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Arena import Arena
+
+
+class FirstMoverWins():
+    """One move game won by the player who makes it."""
+
+    def getInitBoard(self):
+        return np.zeros(1)
+
+    def getCanonicalForm(self, board, player):
+        return board
+
+    def getValidMoves(self, board, player):
+        return np.ones(1)
+
+    def getNextState(self, board, player, action):
+        return board + 1, -player
+
+    def getGameEnded(self, board, player):
+        # the player to move has lost once the move is made
+        return 0 if board[0] == 0 else -1
+
+
+def first(board):
+    return 0
+
+
+def second(board):
+    return 0
+
+
+def test_players_end_swapped_with_and_without_a_stop_rule():
+    for stopRule in (None, lambda oneWon, twoWon, draws: False, lambda oneWon, twoWon, draws: True):
+        arena = Arena(first, second, FirstMoverWins())
+        results = arena.playGames(4, stopRule=stopRule)
+        assert arena.player1 is second and arena.player2 is first
+        # every player wins the games it starts
+        assert results == ((1, 0, 0) if stopRule is not None and stopRule(0, 0, 0) else (2, 2, 0))
@@ -0,0 +1,97 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from MyGame import MyGame
+from MyLogic import Belief, Board, PatternTable, PROB_RISPOSTA_CORRETTA
+
+
+def randomStates(game, count, seed=0):
+    """Canonical states reached by random interrogations of both players."""
+    rng = np.random.RandomState(seed)
+    states = []
+    for _ in range(count):
+        board = game.getInitBoard()
+        player = 1
+        for _ in range(rng.randint(game.n * game.n // 2 + 1)):
+            actions = game.getValidActions(board, player)[:-2]
+            if len(actions) == 0:
+                break
+            board, player = game.getNextState(board, player, rng.choice(actions))
+        states.append(game.getCanonicalForm(board, player))
+    return np.array(states)
+
+
+def posterior(game, state):
+    """
+    Every board with the right number of black cells that agrees with the
+    cells player1 sees, and its posterior weight given player1's answers,
+    by brute force.
+    """
+    nn = game.n * game.n
+    masks = np.arange(2 ** nn)
+    boards = (masks[:, np.newaxis] >> np.arange(nn)) & 1
+    seen = state[nn:2 * nn] == 0
+    boards = boards[(boards.sum(1) == game.belief.n_black) & (boards[:, seen] == state[:nn][seen]).all(1)]
+    answers = state[3 * nn:5 * nn].reshape((nn, 2))
+    # an answer is correct with probability PROB_RISPOSTA_CORRETTA
+    correct = np.where(boards == 1, answers[:, 1], answers[:, 0]).sum(1)
+    wrong = answers.sum() - correct
+    return boards, PROB_RISPOSTA_CORRETTA ** correct * (1 - PROB_RISPOSTA_CORRETTA) ** wrong
+
+
+def test_class_marginals_match_the_dynamic_program():
+    for n in (3, 6, 9):
+        game = MyGame(n)
+        states = randomStates(game, 20)
+        dynamic = game.belief.dynamicMarginals(states)
+        classes = np.array([game.belief.classMarginals(s[np.newaxis])[0] for s in states])
+        assert np.allclose(classes, dynamic, rtol=0, atol=1e-12)
+
+
+def test_cached_marginals_are_the_computed_ones():
+    game = MyGame(4)
+    states = randomStates(game, 10)
+    first = game.belief.marginals(states)
+    assert np.allclose(first, game.belief.dynamicMarginals(states), rtol=0, atol=1e-12)
+    # every state is now a cache hit, alone or in a batch
+    assert np.array_equal(game.belief.marginals(states), first)
+    for s, m in zip(states, first):
+        assert np.array_equal(game.getObservation(s).ravel(), m)
+    # the returned rows are copies, not the cached arrays
+    game.belief.marginals(states)[0][:] = -1
+    assert np.array_equal(game.belief.marginals(states), first)
+
+
+def test_marginals_and_pattern_probability_match_the_enumeration(tmp_path):
+    for n in (3, 4):
+        game = MyGame(n)
+        tabled = Belief(n, table=PatternTable.build(n, str(tmp_path / str(n))))
+        for state in randomStates(game, 30, seed=n):
+            boards, w = posterior(game, state)
+            w = w / w.sum()
+            assert np.allclose(game.belief.marginals(state[np.newaxis])[0], w @ boards, rtol=0, atol=1e-12)
+            p = w @ Board.patternSet(n).exists(boards.reshape((-1, n, n)))
+            assert abs(game.belief.patternProbability(state) - p) < 1e-12
+            assert abs(tabled.patternProbability(state) - p) < 1e-12
+
+
+def test_determinizations_share_the_information_key():
+    game = MyGame(4)
+    nn = game.n * game.n
+    different = 0
+    for state in randomStates(game, 10, seed=1):
+        boards = game.getDeterminizations(state, 50)
+        different += len({b.tobytes() for b in boards}) > 1
+        for player in (1, -1):
+            key = game.getInformationKey(state, player)
+            assert all(game.getInformationKey(b, player) == key for b in boards)
+        # only what player1 cannot see changes
+        seen = np.flatnonzero(state[nn:2 * nn] == 0)
+        assert (boards[:, seen] == state[seen]).all()
+        assert (boards[:, nn:5 * nn] == state[nn:5 * nn]).all()
+    # the determinizations are not all the same board
+    assert different > 0
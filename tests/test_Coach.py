@@ -0,0 +1,30 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Coach import Coach
+from MyGame import MyGame
+from utils import dotdict
+
+
+class UniformNet():
+    def __init__(self, game):
+        self.actionSize = game.getActionSize()
+
+    def predict(self, board):
+        return np.ones(self.actionSize) / self.actionSize, 0.
+
+
+def test_self_play_with_args_written_before_the_parallel_options():
+    game = MyGame(3)
+    # no seed, numSelfPlayWorkers, inferenceServer, numArenaWorkers, nor any
+    # of the newer MCTS options
+    args = dotdict({'numMCTSSims': 4, 'cpuct': 1, 'tempThreshold': 15, 'numEps': 2,
+                    'maxlenOfQueue': 100, 'numItersForTrainExamplesHistory': 2})
+    coach = Coach(game, UniformNet(game), args)
+    assert coach.episodeSeeds(1) == [None, None]
+    episodes = list(coach.selfPlay(1))
+    assert len(episodes) == 2 and all(len(examples) > 0 for examples in episodes)
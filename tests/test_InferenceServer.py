@@ -0,0 +1,57 @@
+import os
+import sys
+import threading
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from InferenceServer import InferenceServer
+
+
+class SumNet():
+    """Network stand-in that records the size of every forward pass."""
+
+    def __init__(self):
+        self.sizes = []
+
+    def predict_batch(self, boards):
+        self.sizes.append(len(boards))
+        return boards.reshape(len(boards), -1), boards.reshape(len(boards), -1).sum(1)
+
+
+def test_batches_never_exceed_max_batch_size():
+    nnet = SumNet()
+    server = InferenceServer(nnet=nnet, maxBatchSize=8, maxWait=0.05)
+    clients = server.start(6)
+    answers = {}
+
+    def query(client):
+        # 3 boards per request: two requests fit in a batch, a third does not
+        boards = np.full((3, 2), client.clientId, dtype=np.float32)
+        answers[client.clientId] = [client.predict_batch(boards) for _ in range(5)]
+
+    threads = [threading.Thread(target=query, args=(c,)) for c in clients]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stats = server.stop()
+
+    assert max(nnet.sizes) <= 8
+    assert stats.boards == sum(nnet.sizes) == 6 * 5 * 3
+    assert 0 < stats.meanFill() <= 1
+    for clientId, results in answers.items():
+        for pis, vs in results:
+            assert (pis == clientId).all() and (vs == 2 * clientId).all()
+
+
+def test_oversized_request_counts_as_a_full_pass():
+    nnet = SumNet()
+    server = InferenceServer(nnet=nnet, maxBatchSize=4, maxWait=0.01)
+    client, = server.start(1)
+    client.predict_batch(np.zeros((10, 2), dtype=np.float32))
+    stats = server.stop()
+
+    assert nnet.sizes == [10]
+    assert stats.meanFill() == 1
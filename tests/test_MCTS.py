@@ -0,0 +1,72 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from MCTS import MCTS
+from MyGame import MyGame
+from utils import dotdict
+
+
+class UniformNet():
+    def __init__(self, game):
+        self.actionSize = game.getActionSize()
+        self.calls = 0
+
+    def predict(self, board):
+        self.calls += 1
+        return np.ones(self.actionSize) / self.actionSize, 0.
+
+    def predict_batch(self, boards):
+        self.calls += 1
+        return np.ones((len(boards), self.actionSize)) / self.actionSize, np.zeros(len(boards))
+
+
+def test_decided_guess_skips_the_search():
+    game = MyGame(3)
+    board = game.getCanonicalForm(game.getInitBoard(), 1)
+    nnet = UniformNet(game)
+    # with threshold 0.5 one of the two guesses is always decided
+    mcts = MCTS(game, nnet, dotdict({'numMCTSSims': 10, 'cpuct': 1, 'guessThreshold': 0.5}))
+    probs = mcts.getActionProb(board, temp=1)
+    p = game.getPatternProbability(board)
+    assert probs[game.n ** 4 if p >= 0.5 else game.n ** 4 + 1] == 1 and sum(probs) == 1
+    assert nnet.calls == 0 and len(mcts.nodes) == 0
+
+
+def test_undecided_guess_searches():
+    game = MyGame(3)
+    board = game.getCanonicalForm(game.getInitBoard(), 1)
+    nnet = UniformNet(game)
+    mcts = MCTS(game, nnet, dotdict({'numMCTSSims': 10, 'cpuct': 1, 'guessThreshold': 1.01}))
+    probs = mcts.getActionProb(board, temp=1)
+    assert nnet.calls > 0 and abs(sum(probs) - 1) < 1e-9
+
+
+def test_chance_edge_q_weights_the_outcomes_by_probability():
+    game = MyGame(3)
+    mcts = MCTS(game, UniformNet(game), dotdict({'numMCTSSims': 10, 'cpuct': 1, 'mctsChance': True}))
+    nodes = mcts.nodes
+    node = nodes.add('root', 0, [0], [1.])
+    e, _ = nodes.edges(node)
+    nodes.chanceP[e] = 0.7
+    # the likely outcome is visited less often than the unlikely one
+    for v, o in ((1., 0), (-1., 1), (-1., 1), (-0.5, 1)):
+        mcts.update(node, e, v, o)
+    q = 0.7 * 1. + 0.3 * (-1. - 1. - 0.5) / 3
+    assert nodes.N[e] == nodes.Ns[node] == 4 and nodes.N0[e] == 1 and nodes.N1[e] == 3
+    assert np.isclose(nodes.W[e] / nodes.N[e], q, rtol=0, atol=1e-12)
+
+
+def test_chance_edge_with_one_visited_outcome_takes_its_mean():
+    game = MyGame(3)
+    mcts = MCTS(game, UniformNet(game), dotdict({'numMCTSSims': 10, 'cpuct': 1, 'mctsChance': True}))
+    nodes = mcts.nodes
+    node = nodes.add('root', 0, [0], [1.])
+    e, _ = nodes.edges(node)
+    nodes.chanceP[e] = 0.7
+    for v in (1., 0.):
+        mcts.update(node, e, v, 1)
+    assert np.isclose(nodes.W[e] / nodes.N[e], 0.5, rtol=0, atol=1e-12)
@@ -0,0 +1,123 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from MCTS import MCTS
+from MyGame import MyGame
+from NodeTable import NodeTable
+from utils import dotdict
+
+
+class InterrogationNet():
+    """
+    Uniform over the interrogations, never guesses, so the tree grows deep,
+    with a value that depends on the board.
+    """
+
+    def __init__(self, game):
+        self.policy = np.ones(game.getActionSize())
+        self.policy[game.n ** 4:] = 0
+        self.policy /= self.policy.sum()
+
+    def predict(self, board):
+        return self.policy, 0.2 * np.sin(np.sum(board * np.arange(board.size).reshape(board.shape)))
+
+
+def snapshot(nodes, keys):
+    """Statistics of the nodes keys, with the child links as state keys."""
+    stats = {}
+    for s in keys:
+        node = nodes.find(s)
+        start, end = nodes.edges(node)
+        edges = {name: getattr(nodes, name)[start:end].copy()
+                 for name in NodeTable.EDGE_ARRAYS + NodeTable.CHANCE_ARRAYS if name not in ('child0', 'child1')}
+        children = [tuple(nodes.keys[c] if c >= 0 else None for c in (nodes.child0[e], nodes.child1[e]))
+                    for e in range(start, end)]
+        stats[s] = (nodes.Ns[node], nodes.Es[node], edges, children)
+    return stats
+
+
+def reachable(nodes, node):
+    """Keys of node and of the nodes reachable from it through the child links."""
+    seen = {node}
+    frontier = [node]
+    while frontier:
+        start, end = nodes.edges(frontier.pop())
+        for c in np.concatenate((nodes.child0[start:end], nodes.child1[start:end])):
+            if c >= 0 and c not in seen:
+                seen.add(c)
+                frontier.append(c)
+    return {nodes.keys[c] for c in seen}
+
+
+def chanceSearch(n=3, sims=200):
+    game = MyGame(n)
+    # getInitBoard draws the board and the masks from the global RNG
+    np.random.seed(0)
+    mcts = MCTS(game, InterrogationNet(game), dotdict({'numMCTSSims': sims, 'cpuct': 10, 'mctsChance': True}))
+    board = game.getCanonicalForm(game.getInitBoard(), 1)
+    for _ in range(sims):
+        mcts.search(board)
+    return game, mcts, board
+
+
+def test_reroot_keeps_the_chosen_subtree():
+    game, mcts, board = chanceSearch()
+    nodes = mcts.nodes
+    root = nodes.find(game.getStateKey(board, 1))
+    start, end = nodes.edges(root)
+    # second outcome of an edge, so that the new root is not node 1
+    e = start + int(np.argmax(nodes.N1[start:end]))
+    child = nodes.child1[e]
+    assert child > 1
+
+    keys = reachable(nodes, child)
+    assert len(keys) < len(nodes)
+    before = snapshot(nodes, keys)
+    assert nodes.reroot(child) == 0
+    assert set(nodes.keys) == keys and len(nodes) == len(keys)
+    assert nodes.numEdges == sum(nodes.edgeCount[:len(nodes)])
+    after = snapshot(nodes, keys)
+    for s in keys:
+        Ns, Es, edges, children = before[s]
+        assert after[s][0] == Ns and after[s][1] == Es and after[s][3] == children
+        for name, array in edges.items():
+            assert np.array_equal(after[s][2][name], array), name
+
+
+def test_reroot_with_max_nodes_cuts_the_dropped_links():
+    game, mcts, board = chanceSearch()
+    nodes = mcts.nodes
+    root = nodes.find(game.getStateKey(board, 1))
+    before = snapshot(nodes, nodes.keys)
+    assert nodes.reroot(root, 10) == 0
+    assert len(nodes) == 10 and nodes.keys[0] == game.getStateKey(board, 1)
+    for s in nodes.keys:
+        Ns, Es, edges, children = before[s]
+        start, end = nodes.edges(nodes.find(s))
+        assert nodes.Ns[nodes.find(s)] == Ns
+        assert np.array_equal(nodes.N[start:end], edges['N'])
+        for e, pair in zip(range(start, end), children):
+            for c, key in zip((nodes.child0[e], nodes.child1[e]), pair):
+                # a link survives if and only if its child was kept
+                assert (nodes.keys[c] if c >= 0 else None) == (key if key in nodes.ids else None)
+
+
+def test_chance_edges_average_their_outcomes_by_probability():
+    game, mcts, board = chanceSearch()
+    nodes = mcts.nodes
+    edges = np.arange(nodes.numEdges)
+    chance = edges[(nodes.N0[edges] + nodes.N1[edges]) > 0]
+    assert len(chance) and (nodes.N[chance] == nodes.N0[chance] + nodes.N1[chance]).all()
+    for e in chance:
+        p0, n0, n1 = nodes.chanceP[e], nodes.N0[e], nodes.N1[e]
+        if n0 > 0 and n1 > 0:
+            q = p0 * nodes.W0[e] / n0 + (1 - p0) * nodes.W1[e] / n1
+        else:
+            q = nodes.W0[e] / n0 if n0 > 0 else nodes.W1[e] / n1
+        assert np.isclose(nodes.W[e] / nodes.N[e], q, rtol=0, atol=1e-12)
+        # the outcomes are visited in proportion to their probabilities
+        assert abs(n0 - p0 * nodes.N[e]) <= 1
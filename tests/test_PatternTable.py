@@ -0,0 +1,27 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from MyLogic import Board, PatternTable
+
+
+def allBoards(n):
+    masks = np.arange(2 ** (n * n))
+    return (masks[:, np.newaxis] >> np.arange(n * n)) & 1
+
+
+def test_table_matches_the_pattern_search(tmp_path):
+    for n in (2, 3):
+        # a chunk smaller than the table, so that several chunks are written
+        table = PatternTable.build(n, str(tmp_path), chunk=64)
+        boards = allBoards(n)
+        assert (table.lookup(boards) == Board.patternSet(n).exists(boards.reshape((-1, n, n)))).all()
+
+
+def test_chunks_do_not_change_the_table(tmp_path):
+    small = PatternTable.build(3, str(tmp_path / 'small'), chunk=8)
+    large = PatternTable.build(3, str(tmp_path / 'large'))
+    assert np.array_equal(small.bits, large.bits)
@@ -0,0 +1,76 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ReplayBuffer import ReplayBuffer
+
+
+def makeBuffer(count, v, capacity=100):
+    buffer = ReplayBuffer((3, 3), 83, capacity)
+    buffer.addIteration(np.zeros((count, 3, 3)), np.zeros((count, 83)), np.full(count, v))
+    return buffer
+
+
+def test_fresh_buffer_does_not_reuse_shards_of_an_earlier_run(tmp_path):
+    folder = str(tmp_path / 'examples')
+    makeBuffer(10, 1).save(folder)
+    # a new run starts again from iteration id 0 in the same folder
+    makeBuffer(7, -1).save(folder)
+
+    loaded = ReplayBuffer.load(folder, 100)
+    assert len(loaded) == 7
+    assert (loaded.vs[loaded.indices()] == -1).all()
+
+
+def test_incremental_save_after_load(tmp_path):
+    folder = str(tmp_path / 'examples')
+    buffer = makeBuffer(10, 1)
+    buffer.save(folder)
+    loaded = ReplayBuffer.load(folder, 100)
+    loaded.addIteration(np.zeros((5, 3, 3)), np.zeros((5, 83)), np.full(5, -1))
+    loaded.save(folder)
+
+    again = ReplayBuffer.load(folder, 100)
+    assert list(again.vs[again.indices()]) == [1] * 10 + [-1] * 5
+    assert sorted(os.listdir(folder)) == sorted(
+        [ReplayBuffer.MANIFEST] + [os.path.basename(again.shardFile(folder, i, c))
+                                   for i in (0, 1) for c in ReplayBuffer.COLUMNS])
+
+
+def test_prefetch_stops_when_sampling_fails_after_an_early_exit():
+    buffer = makeBuffer(10, 1)
+    calls = []
+
+    def sample(batchSize):
+        calls.append(batchSize)
+        if len(calls) > 2:
+            raise ValueError('sampling failed')
+        return np.zeros((batchSize, 3, 3)), np.zeros((batchSize, 83)), np.zeros(batchSize)
+
+    buffer.sample = sample
+    batches = buffer.prefetch(4, 10, depth=1)
+    next(batches)
+    # the producer hits the error while the queue is full: closing the
+    # generator must not leave it blocked on the put
+    while len(calls) < 3:
+        time.sleep(0.01)
+    batches.close()
+
+
+def test_prefetch_raises_the_sampling_error():
+    buffer = makeBuffer(10, 1)
+
+    def sample(batchSize):
+        raise ValueError('sampling failed')
+
+    buffer.sample = sample
+    try:
+        list(buffer.prefetch(4, 3))
+    except ValueError:
+        pass
+    else:
+        assert False, 'the error of the producer was not raised'
@@ -0,0 +1,69 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from MyGame import MyGame
+from MyLogic import Board
+
+
+def randomCanonicalBoards(game, count, rng):
+    boards = []
+    for _ in range(count):
+        board = game.getInitBoard()
+        player = 1
+        for _ in range(rng.integers(game.n * game.n // 2)):
+            actions = game.getValidActions(board, player)[:-2]
+            board, player = game.getNextState(board, player, rng.choice(actions))
+        boards.append(game.getCanonicalForm(board, player))
+    return boards
+
+
+def transform(game, board, k):
+    """Symmetry k of a compact state, with its hashes recomputed."""
+    form = board[game.symmetries.states[k]]
+    z = Board.zobrist(game.n)
+    z.write(form, *z.hashes(form))
+    return form
+
+
+def test_representative_is_invariant_under_the_8_symmetries():
+    rng = np.random.default_rng(0)
+    for n in (3, 4, 5):
+        game = MyGame(n)
+        z = Board.zobrist(n)
+        for board in randomCanonicalBoards(game, 10, rng):
+            representative, sym = game.getSymmetryRepresentative(board)
+            assert np.array_equal(representative, transform(game, board, sym))
+            assert np.array_equal(z.hashes(representative), z.read(representative))
+            for k in range(8):
+                assert np.array_equal(game.getSymmetryRepresentative(transform(game, board, k))[0], representative)
+
+
+def test_actions_round_trip_through_the_representative():
+    rng = np.random.default_rng(1)
+    for n in (3, 4):
+        game = MyGame(n)
+        A = game.getActionSize()
+        for board in randomCanonicalBoards(game, 10, rng):
+            for k in range(8):
+                form = transform(game, board, k)
+                actions = game.getSymmetryActions(k)
+                assert sorted(actions) == list(range(A))
+                # action a of the form is action actions[a] of the board
+                assert np.array_equal(game.getValidMoves(form, 1), game.getValidMoves(board, 1)[actions])
+                for a in rng.choice(np.flatnonzero(game.getValidMoves(form, 1)), 5):
+                    for (after, _, p), (expected, _, q) in zip(game.getNextStates(form, 1, a),
+                                                              game.getNextStates(board, 1, actions[a])):
+                        assert p == q
+                        assert np.array_equal(after, transform(game, expected, k))
+                # a policy over the form, mapped back to the board and
+                # transformed again, is unchanged
+                pi = rng.random(A)
+                back = np.empty(A)
+                back[actions] = pi
+                boards, pis = game.getSymmetriesBatch(game.getObservation(board)[np.newaxis], back[np.newaxis])
+                assert np.array_equal(pis[k], pi)
+                assert np.allclose(boards[k], game.getObservation(form))
@@ -0,0 +1,79 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from MyGame import MyGame
+from MyLogic import Board
+from VecMyGame import VecMyGame
+
+
+def assertHashes(z, states):
+    h, hs = z.hashes(states)
+    rh, rhs = z.read(states)
+    assert np.array_equal(h, rh) and np.array_equal(hs, rhs)
+
+
+def randomAction(valids, rng):
+    # mostly interrogations, so that the games last
+    interrogations = np.flatnonzero(valids[:-2])
+    if len(interrogations) and rng.random() < 0.9:
+        return rng.choice(interrogations)
+    return rng.choice(np.flatnonzero(valids))
+
+
+def test_board_hashes_follow_every_move():
+    rng = np.random.default_rng(0)
+    for n in (3, 4):
+        z = Board.zobrist(n)
+        for _ in range(5):
+            b = Board(n)
+            player = 1
+            assertHashes(z, b.toState())
+            while True:
+                moves = b.get_legal_moves(player)
+                interrogations = moves[:-2]
+                if len(interrogations) and rng.random() < 0.9:
+                    move = interrogations[rng.integers(len(interrogations))]
+                else:
+                    move = moves[-2 + rng.integers(2)]
+                b.execute_move(move, player)
+                state = b.toState()
+                assertHashes(z, state)
+                if b.guess1 != 0 or b.guess2 != 0:
+                    break
+                player = -player
+
+
+def test_game_hashes_and_state_keys():
+    rng = np.random.default_rng(1)
+    for n in (3, 4):
+        game = MyGame(n)
+        z = Board.zobrist(n)
+        for _ in range(5):
+            board = game.getInitBoard()
+            player = 1
+            while game.getGameEnded(board, player) == 0:
+                assertHashes(z, board)
+                for p in (1, -1):
+                    canonical = game.getCanonicalForm(board, p)
+                    assertHashes(z, canonical)
+                    assert game.getStateKey(board, p) == game.stringRepresentation(canonical)
+                action = randomAction(game.getValidMoves(game.getCanonicalForm(board, player), 1), rng)
+                for outcome, _, _ in game.getNextStates(board, player, action):
+                    assertHashes(z, outcome)
+                board, player = game.getNextState(board, player, action)
+
+
+def test_vectorized_hashes_follow_every_move():
+    rng = np.random.default_rng(2)
+    for n in (3, 4):
+        games = VecMyGame(n, 32, np.random.default_rng(n))
+        z = Board.zobrist(n)
+        for _ in range(40):
+            actions = np.array([randomAction(v, rng) for v in games.getValidMoves()])
+            games.getNextState(actions)
+            assertHashes(z, games.boards)
+            assertHashes(z, games.getCanonicalForm())
@@ -19,4 +19,8 @@ class AverageMeter(object):
 
 class dotdict(dict):
     def __getattr__(self, name):
+        if name.startswith('__'):
+            # special methods looked up by pickle and copy must not be
+            # mistaken for keys, or the args cannot be sent to a worker
+            raise AttributeError(name)
         return self[name]